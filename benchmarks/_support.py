@@ -0,0 +1,82 @@
+"""
+Shared helpers for the benchmark scripts.
+
+The integration's API modules are loaded by path (like eero_tracker_instantiate.py
+does) so the benchmarks run without Home Assistant installed.
+"""
+import os
+import sys
+import types
+import importlib
+import random
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMPONENT_DIR = os.path.join(REPO_DIR, 'custom_components', 'eero_tracker')
+
+
+def load(module_name):
+    """Imports eero_tracker.<module_name> without running the integration's __init__"""
+    if 'eero_tracker' not in sys.modules:
+        package = types.ModuleType('eero_tracker')
+        package.__path__ = [COMPONENT_DIR]
+        sys.modules['eero_tracker'] = package
+    return importlib.import_module(f"eero_tracker.{module_name}")
+
+
+def synthetic_mac(rng):
+    return ':'.join(f"{rng.randrange(256):02x}" for _ in range(6))
+
+
+def synthetic_device(rng, network_id, index):
+    """A device entry shaped like the ones returned by networks/{id}/devices"""
+    mac = synthetic_mac(rng)
+    wireless = rng.random() < 0.8
+    return {
+        'url': f"/2.2/networks/{network_id}/devices/{mac.replace(':', '')}",
+        'mac': mac,
+        'eui64': mac.replace(':', '') + 'fffe',
+        'manufacturer': rng.choice(['Apple, Inc.', 'Samsung', 'Google', 'Sonos, Inc.', None]),
+        'ip': f"192.168.{index // 250}.{index % 250 + 2}",
+        'ips': [f"192.168.{index // 250}.{index % 250 + 2}"],
+        'nickname': rng.choice([None, f"device-{index}"]),
+        'hostname': f"host-{index}",
+        'connected': rng.random() < 0.7,
+        'wireless': wireless,
+        'connection_type': 'wireless' if wireless else 'wired',
+        'source': {
+            'location': rng.choice(['Living Room', 'Office', 'Basement']),
+            'gateway': False,
+            'model': 'eero Pro 6',
+            'display_name': 'eero Pro 6',
+            'url': f"/2.2/eeros/{rng.randrange(1000, 9999)}",
+        },
+        'last_active': '2026-10-17T12:00:00.000Z',
+        'first_active': '2025-01-01T00:00:00.000Z',
+        'connectivity': {
+            'rx_bitrate': '866.7 MBit/s',
+            'signal': f"-{rng.randrange(30, 80)} dBm",
+            'signal_avg': None,
+            'score': rng.random(),
+            'score_bars': rng.randrange(1, 6),
+            'frequency': rng.choice([2412, 5180, 5745]),
+        },
+        'interface': {'frequency': rng.choice(['2.4', '5']), 'frequency_unit': 'GHz'},
+        'usage': None,
+        'profile': None,
+        'device_type': rng.choice(['phone', 'laptop', 'tv', 'speaker']),
+        'blacklisted': False,
+        'is_guest': False,
+        'paused': False,
+        'channel': rng.choice([1, 6, 11, 36, 149]),
+        'auth': 'wpa2',
+        'is_private': False,
+        'secondary_wan_deny_access': False,
+        'ring_lte': {'is_not_pausable': False, 'ring_paused': False, 'lte_enabled': False},
+        'ipv4': f"192.168.{index // 250}.{index % 250 + 2}",
+        'ipv6_addresses': [{'address': f"fe80::{index:x}", 'scope': 'link', 'interface': 'br-lan'}],
+    }
+
+
+def synthetic_devices(count, network_id=1, seed=0):
+    rng = random.Random(seed + network_id)
+    return [synthetic_device(rng, network_id, index) for index in range(count)]
@@ -0,0 +1,69 @@
+"""
+Compares CPU time and peak memory of the ways a devices response can be parsed:
+
+  legacy      json.loads(text), then the json.loads(json.dumps(..., indent=4)) round-trip
+  full        a single json.loads of the raw bytes
+  streaming   parse_devices() with the stdlib streaming projection
+  orjson      parse_devices() with orjson (skipped when orjson is not installed)
+
+usage: python benchmarks/bench_parse_devices.py [device counts...]
+"""
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+from _support import load, synthetic_devices
+
+parser = load('parser')
+
+
+def legacy(body):
+    data = json.loads(body.decode('utf-8'))['data']
+    return json.loads(json.dumps(data, indent=4))
+
+
+def full(body):
+    return json.loads(body)['data']
+
+
+def streaming(body):
+    return parser.parse_devices(body, use_orjson=False)
+
+
+def with_orjson(body):
+    return parser.parse_devices(body)
+
+
+def measure(func, body, repeat):
+    gc.collect()
+    start = time.process_time()
+    for _ in range(repeat):
+        func(body)
+    cpu = (time.process_time() - start) / repeat
+
+    gc.collect()
+    tracemalloc.start()
+    func(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cpu, peak
+
+
+def main(counts):
+    modes = [('legacy', legacy), ('full', full), ('streaming', streaming)]
+    if parser.orjson is not None:
+        modes.append(('orjson', with_orjson))
+
+    print(f"{'devices':>8} {'payload':>10} {'mode':>10} {'cpu ms':>9} {'peak KiB':>10}")
+    for count in counts:
+        body = json.dumps({'meta': {'code': 200}, 'data': synthetic_devices(count)}).encode('utf-8')
+        repeat = max(1, 20000 // count)
+        for name, func in modes:
+            cpu, peak = measure(func, body, repeat)
+            print(f"{count:>8} {len(body) // 1024:>8}Ki {name:>10} {cpu * 1000:>9.2f} {peak // 1024:>10}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 5000])
@@ -0,0 +1,191 @@
+"""
+Scan benchmark against the local mock eero API.
+
+Reports scan latency, requests per scan, CPU time per scan and peak traced
+memory for each scan path:
+
+  client    eero.Eero fetching every network in turn (what the CLI does)
+  async     eero.AsyncClient fetching every network concurrently
+  scanner   EeroDeviceScanner.scan_devices (needs Home Assistant installed)
+
+usage: python benchmarks/bench_scan.py --networks 10 --devices 500 --latency 0.05
+"""
+import asyncio
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+from _support import load
+from mock_eero_api import MockAccount, MockEeroServer
+
+eero = load('eero')
+response_cache = load('cache').shared_cache()
+
+
+class ScanResult(object):
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.cpu_times = []
+        self.requests = []
+        self.peak_memory = None
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"{self.name:>8}  "
+              f"latency mean {statistics.mean(latencies) * 1000:8.1f} ms  "
+              f"p95 {p95 * 1000:8.1f} ms  "
+              f"cpu {statistics.mean(self.cpu_times) * 1000:7.1f} ms  "
+              f"requests/scan {statistics.mean(self.requests):5.1f}  "
+              f"peak {self.peak_memory // 1024 if self.peak_memory is not None else '-':>7} KiB")
+
+
+def measure(name, server, scan, scans):
+    """Times scan() scans times, then once more under tracemalloc for the memory peak.
+
+    The response cache is cleared before each scan, so every scan reaches the server.
+    """
+    result = ScanResult(name)
+    scan()  # warm up connections and caches
+    for _ in range(scans):
+        response_cache.clear()
+        server.reset_counters()
+        wall, cpu = time.perf_counter(), time.process_time()
+        scan()
+        result.latencies.append(time.perf_counter() - wall)
+        result.cpu_times.append(time.process_time() - cpu)
+        result.requests.append(server.total_requests)
+
+    response_cache.clear()
+    tracemalloc.start()
+    scan()
+    result.peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result
+
+
+def client_scan(account, server, work_dir):
+    session_file = os.path.join(work_dir, 'client.session')
+    with open(session_file, 'w') as f:
+        f.write(account.issue_session())
+    client = eero.Eero(eero.CookieStore(session_file), eero.Client(api_endpoint=server.api_endpoint))
+    networks = client.account()['networks']['data']
+
+    def scan():
+        for network in networks:
+            client.devices(network['url'], fields=('connected', 'wireless', 'mac', 'nickname', 'hostname'))
+    return scan
+
+
+def async_scan(account, server, concurrency):
+    import aiohttp
+
+    token = account.issue_session()
+    actions = [f"networks/{network_id}/devices" for network_id in account.network_ids]
+    loop = asyncio.new_event_loop()
+
+    async def create():
+        return aiohttp.ClientSession()
+    session = loop.run_until_complete(create())
+    client = eero.AsyncClient(session, concurrency, api_endpoint=server.api_endpoint)
+
+    def scan():
+        loop.run_until_complete(client.get_many(actions, cookies=dict(s=token)))
+
+    def close():
+        loop.run_until_complete(session.close())
+        loop.close()
+    return scan, close
+
+
+class _BenchConfig(object):
+    def __init__(self, config_dir):
+        self.config_dir = config_dir
+
+    def path(self, *parts):
+        return os.path.join(self.config_dir, *parts)
+
+
+class BenchHass(object):
+    """Just enough of Home Assistant's hass object for the synchronous scan path"""
+
+    def __init__(self, config_dir):
+        self.config = _BenchConfig(config_dir)
+        self.data = {}
+        self._executor = ThreadPoolExecutor(max_workers=2)
+
+    def add_job(self, target, *args):
+        self._executor.submit(target, *args)
+
+
+def scanner_scan(account, server, work_dir):
+    try:
+        device_tracker = load('device_tracker')
+    except ImportError as exception:
+        print(f"skipping scanner benchmark ({exception})")
+        return None
+
+    with open(os.path.join(work_dir, 'eero.session'), 'w') as f:
+        f.write(account.issue_session())
+
+    class BenchScanner(device_tracker.EeroDeviceScanner):
+        API_ENDPOINT = server.api_endpoint
+
+    # unlimited request budget, so the benchmark measures the scan path itself
+    config = device_tracker.PLATFORM_SCHEMA({'platform': 'eero_tracker', 'max_requests_per_minute': 0})
+    scanner = BenchScanner(BenchHass(work_dir), config)
+
+    def scan():
+        # make every network due, so each iteration is a full scan
+        scanner.reset_schedule()
+        scanner.scan_devices()
+    return scan
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--networks', type=int, default=5)
+    parser.add_argument('--devices', type=int, default=200, help='devices per network')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds of server latency per request')
+    parser.add_argument('--scans', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=4, help='async client request limit')
+    parser.add_argument('--churn', type=float, default=0.0)
+    parser.add_argument('--refresh-every', type=int, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--modes', default='client,async,scanner')
+    args = parser.parse_args()
+
+    account = MockAccount(args.networks, args.devices, args.churn)
+    server = MockEeroServer(account, latency=args.latency, error_rate=args.error_rate,
+                            refresh_every=args.refresh_every).start()
+    work_dir = tempfile.mkdtemp(prefix='eero-bench-')
+    print(f"{args.networks} networks x {args.devices} devices, {args.latency * 1000:.0f} ms latency, "
+          f"{args.scans} scans")
+
+    try:
+        modes = args.modes.split(',')
+        if 'client' in modes:
+            measure('client', server, client_scan(account, server, work_dir), args.scans).report()
+        if 'async' in modes:
+            scan, close = async_scan(account, server, args.concurrency)
+            try:
+                measure('async', server, scan, args.scans).report()
+            finally:
+                close()
+        if 'scanner' in modes:
+            scan = scanner_scan(account, server, work_dir)
+            if scan is not None:
+                measure('scanner', server, scan, args.scans).report()
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Regression check for session refreshes against the local mock eero API.
+
+Two callers in one process share a session file. Both send a request with
+the expired key T1; the first refreshes it to T2, and only then does the
+second get its 401 and ask for a refresh. The second caller must retry with
+T2 rather than refresh again: a second login/refresh would invalidate the
+key the first caller just got (eero answers error.session.invalid).
+
+usage: python benchmarks/check_session_refresh.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+from _support import load
+from mock_eero_api import MockAccount, MockEeroServer
+
+eero = load('eero')
+
+
+def main():
+    account = MockAccount(networks=1, devices=5)
+    server = MockEeroServer(account).start()
+    directory = tempfile.mkdtemp()
+    try:
+        session_file = os.path.join(directory, 'eero.session')
+        with open(session_file, 'w') as f:
+            f.write(account.issue_session())
+
+        client = eero.Client(api_endpoint=server.api_endpoint, cache=None)
+        first = eero.Eero(eero.CookieStore(session_file), client)
+        second = eero.Eero(eero.CookieStore(session_file), client)
+        account.expire_sessions()
+        server.reset_counters()
+
+        def request(cookies):
+            try:
+                return client.get('account', cookies=cookies)
+            finally:
+                if not request.peer_done:
+                    # this request failed on T1; the peer fails on T1 too and refreshes it first
+                    request.peer_done = True
+                    first.account()
+        request.peer_done = False
+
+        second.refreshed(request)
+        first.account()  # the peer's key must still be valid
+        refreshes = server.requests['login/refresh']
+    finally:
+        server.stop()
+        shutil.rmtree(directory)
+
+    print(f"login/refresh requests: {refreshes} (expected 1)")
+    return 0 if refreshes == 1 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+Local stand-in for api-user.e2ro.com/2.2, for exercising the client and scanner
+without a real eero account.
+
+Covers login, login/verify, login/refresh, account and networks/{id}/devices
+for a synthetic account of N networks x M devices, with optional latency,
+forced session refreshes and injected errors. Run it standalone:
+
+    python benchmarks/mock_eero_api.py --networks 5 --devices 200 --port 8080
+
+and point a client at http://127.0.0.1:8080/2.2/{} (any verification code is accepted).
+"""
+import gzip
+import json
+import random
+import re
+import socket
+import threading
+import time
+from argparse import ArgumentParser
+from collections import Counter
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from _support import synthetic_devices
+
+_DEVICES_PATH = re.compile(r'^/2\.2/networks/(\d+)/devices$')
+
+
+class MockAccount(object):
+    """Synthetic account state shared by all request handler threads"""
+
+    def __init__(self, networks=1, devices=50, churn=0.0, seed=0):
+        self.network_ids = [10000 + index for index in range(networks)]
+        self.devices = {network_id: synthetic_devices(devices, network_id, seed) for network_id in self.network_ids}
+        self.churn = churn
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.pending_tokens = set()
+        self.valid_tokens = set()
+        self.stale_tokens = set()
+        self.token_counter = 0
+
+    def new_token(self):
+        with self.lock:
+            self.token_counter += 1
+            return f"mock-token-{self.token_counter}"
+
+    def issue_session(self):
+        """Returns a token that is already valid, e.g. for writing a session file directly"""
+        token = self.new_token()
+        self.valid_tokens.add(token)
+        return token
+
+    def expire_sessions(self):
+        """Makes every current session answer 401 error.session.refresh"""
+        with self.lock:
+            self.stale_tokens |= self.valid_tokens
+            self.valid_tokens.clear()
+
+    def account(self):
+        return {
+            'name': 'Mock Account',
+            'networks': {
+                'count': len(self.network_ids),
+                'data': [{'url': f"/2.2/networks/{network_id}", 'name': f"Network {network_id}"}
+                         for network_id in self.network_ids],
+            },
+        }
+
+    def network_devices(self, network_id):
+        devices = self.devices[network_id]
+        if self.churn:
+            with self.lock:
+                for device in devices:
+                    if self.rng.random() < self.churn:
+                        device['connected'] = not device['connected']
+        return devices
+
+
+class MockEeroServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, account, port=0, latency=0.0, error_rate=0.0, rate_limit_rate=0.0, refresh_every=0, seed=0):
+        super(MockEeroServer, self).__init__(('127.0.0.1', port), MockEeroHandler)
+        self.account = account
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.refresh_every = refresh_every
+        self.authorized_requests = 0
+        self.rng = random.Random(seed)
+        self.requests = Counter()
+        self.bytes_sent = 0
+        self._thread = None
+
+    @property
+    def api_endpoint(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/2.2/{{}}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def reset_counters(self):
+        self.requests.clear()
+        self.bytes_sent = 0
+
+    @property
+    def total_requests(self):
+        return sum(self.requests.values())
+
+
+class MockEeroHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super(MockEeroHandler, self).setup()
+        # headers and body go out in separate writes; don't let Nagle delay keep-alive replies
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _session_token(self):
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        return cookie['s'].value if 's' in cookie else None
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _send(self, http_status, body):
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=1)
+            encoding = 'gzip'
+        else:
+            encoding = None
+
+        self.send_response(http_status)
+        self.send_header('Content-Type', 'application/json' if http_status < 500 else 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.bytes_sent += len(body)
+
+    def _send_envelope(self, code, data=None, error=None):
+        meta = {'code': code, 'server_time': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())}
+        if error:
+            meta['error'] = error
+        body = json.dumps({'meta': meta, 'data': data if data is not None else {}}).encode('utf-8')
+        self._send(code if code >= 400 else 200, body)
+
+    def _endpoint(self):
+        match = _DEVICES_PATH.match(self.path)
+        if match:
+            return 'networks/{id}/devices'
+        return self.path[len('/2.2/'):]
+
+    def _inject(self):
+        """Applies latency and random errors; returns True if an error was sent"""
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        roll = server.rng.random()
+        if roll < server.rate_limit_rate:
+            self._send_envelope(429, error='error.rate_limit')
+            return True
+        if roll < server.rate_limit_rate + server.error_rate:
+            self._send(503, b'<html><body>503 Service Unavailable</body></html>')
+            return True
+        return False
+
+    def _authorized(self):
+        server = self.server
+        account = server.account
+        if server.refresh_every:
+            with account.lock:
+                server.authorized_requests += 1
+                expire = server.authorized_requests % server.refresh_every == 0
+            if expire:
+                account.expire_sessions()
+
+        token = self._session_token()
+        if token in account.valid_tokens:
+            return True
+        if token in account.stale_tokens:
+            self._send_envelope(401, error='error.session.refresh')
+        else:
+            self._send_envelope(401, error='error.session.invalid')
+        return False
+
+    def do_POST(self):
+        self.server.requests[self._endpoint()] += 1
+        body = self._read_json()
+        if self._inject():
+            return
+
+        account = self.server.account
+        if self.path == '/2.2/login':
+            if not body.get('login'):
+                return self._send_envelope(400, error='error.login.missing')
+            token = account.new_token()
+            account.pending_tokens.add(token)
+            return self._send_envelope(200, {'user_token': token})
+
+        if self.path == '/2.2/login/verify':
+            token = self._session_token()
+            if token not in account.pending_tokens or not body.get('code'):
+                return self._send_envelope(401, error='error.verification.invalid')
+            account.pending_tokens.discard(token)
+            account.valid_tokens.add(token)
+            return self._send_envelope(200, {'name': 'Mock Account'})
+
+        if self.path == '/2.2/login/refresh':
+            token = self._session_token()
+            if token not in account.stale_tokens and token not in account.valid_tokens:
+                return self._send_envelope(401, error='error.session.invalid')
+            account.stale_tokens.discard(token)
+            account.valid_tokens.discard(token)
+            return self._send_envelope(200, {'user_token': account.issue_session()})
+
+        self._send_envelope(404, error='error.not_found')
+
+    def do_GET(self):
+        self.server.requests[self._endpoint()] += 1
+        if self._inject() or not self._authorized():
+            return
+
+        account = self.server.account
+        if self.path == '/2.2/account':
+            return self._send_envelope(200, account.account())
+
+        match = _DEVICES_PATH.match(self.path)
+        if match and int(match.group(1)) in account.devices:
+            return self._send_envelope(200, account.network_devices(int(match.group(1))))
+
+        self._send_envelope(404, error='error.not_found')
+
+
+def main():
+    parser = ArgumentParser(description='Serve a synthetic eero API locally')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--networks', type=int, default=1)
+    parser.add_argument('--devices', type=int, default=50, help='devices per network')
+    parser.add_argument('--churn', type=float, default=0.0, help='chance a device flips connected per poll')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 503')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='fraction of requests answered with a 429')
+    parser.add_argument('--refresh-every', type=int, default=0,
+                        help='expire the session (401 error.session.refresh) every N authenticated requests')
+    parser.add_argument('--session-file', help='write a valid session token here')
+    args = parser.parse_args()
+
+    account = MockAccount(args.networks, args.devices, args.churn)
+    server = MockEeroServer(account, args.port, args.latency, args.error_rate, args.rate_limit_rate,
+                            args.refresh_every)
+    if args.session_file:
+        with open(args.session_file, 'w') as f:
+            f.write(account.issue_session())
+    print(f"Serving mock eero API at {server.api_endpoint.format('')}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,203 @@
+from aiohttp import web
+import voluptuous as vol
+
+import homeassistant.helpers.config_validation as cv
+from homeassistant.components.http import HomeAssistantView
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP, Platform
+from homeassistant.core import SupportsResponse
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.discovery import async_load_platform
+import homeassistant.util.dt as dt_util
+
 from .const import (
-    DOMAIN
+    ATTR_END,
+    ATTR_MAC,
+    ATTR_MODE,
+    ATTR_SCANS,
+    ATTR_START,
+    ATTR_STOP,
+    DATA_COORDINATORS,
+    DATA_SCANNERS,
+    DOMAIN,
+    SERVICE_FORCE_REFRESH,
+    SERVICE_INVALIDATE_ACCOUNT_CACHE,
+    SERVICE_MEMORY_SNAPSHOT,
+    SERVICE_PROFILE_SCANS,
+    SERVICE_QUERY_PRESENCE_HISTORY,
+)
+from .coordinator import EeroDataUpdateCoordinator
+from .filters import format_mac, mac_to_int
+from .metrics import METRICS
+from .profiling import MEMORY, MODE_CPROFILE, MODE_SAMPLING, PROFILER
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+PLATFORMS = [Platform.DEVICE_TRACKER, Platform.SENSOR]
+
+
+def _mac(value):
+    if mac_to_int(cv.string(value)) is None:
+        raise vol.Invalid(f"Invalid MAC address: {value}")
+    return value
+
+
+QUERY_PRESENCE_HISTORY_SCHEMA = vol.All(
+    vol.Schema({
+        vol.Optional(ATTR_MAC): _mac,
+        vol.Optional(ATTR_START): cv.datetime,
+        vol.Optional(ATTR_END): cv.datetime,
+    }),
+    cv.has_at_least_one_key(ATTR_MAC, ATTR_START),
 )
 
-def setup(hass, config):
+
+PROFILE_SCANS_SCHEMA = vol.Schema({
+    vol.Optional(ATTR_SCANS, default=5): vol.All(vol.Coerce(int), vol.Range(min=1, max=100)),
+    vol.Optional(ATTR_MODE, default=MODE_CPROFILE): vol.In([MODE_CPROFILE, MODE_SAMPLING]),
+})
+
+MEMORY_SNAPSHOT_SCHEMA = vol.Schema({
+    vol.Optional(ATTR_STOP, default=False): cv.boolean,
+})
+
+
+class EeroMetricsView(HomeAssistantView):
+    """Serves the scan and request metrics in the Prometheus text format"""
+
+    url = '/api/eero_tracker/metrics'
+    name = 'api:eero_tracker:metrics'
+
+    async def get(self, request):
+        return web.Response(body=METRICS.render_prometheus().encode('utf-8'),
+                            headers={'Content-Type': PROMETHEUS_CONTENT_TYPE})
+
+
+def _iso(timestamp):
+    return dt_util.utc_from_timestamp(timestamp).isoformat()
+
+
+def _query_presence_history(scanners, mac, start, end):
+    """Runs in the executor: answers from each scanner's history and latest snapshot"""
+    response = {}
+    if mac is not None:
+        canonical = format_mac(mac_to_int(mac))
+        present = any(canonical in scanner.snapshot for scanner in scanners)
+        latest = None
+        for scanner in scanners:
+            transition = scanner.history.last_transition(mac)
+            if transition is not None and (latest is None or transition.timestamp > latest.timestamp):
+                latest = transition
+        if present:
+            last_seen = dt_util.utcnow().isoformat()
+        elif latest is not None:
+            last_seen = _iso(latest.timestamp)
+        else:
+            last_seen = None
+        response['device'] = dict(mac=canonical, present=present, last_seen=last_seen,
+                                  last_transition=_transition(latest))
+
+    if start is not None:
+        online = set()
+        for scanner in scanners:
+            online |= scanner.history.online_between(start, end)
+        response['online'] = sorted(format_mac(value) for value in online)
+        response['start'] = _iso(start)
+        response['end'] = _iso(end)
+    return response
+
+
+def _transition(transition):
+    if transition is None:
+        return None
+    result = transition.as_dict()
+    result['timestamp'] = _iso(transition.timestamp)
+    return result
+
+
+async def async_setup(hass, config):
+    def scanners():
+        return hass.data.get(DOMAIN, {}).get(DATA_SCANNERS, [])
+
+    async def invalidate_account_cache(call):
+        # only marks the caches expired; the refetch itself runs in the background
+        for scanner in scanners():
+            scanner.invalidate_account_cache()
+        for coordinator in hass.data.get(DOMAIN, {}).get(DATA_COORDINATORS, {}).values():
+            coordinator.invalidate_account_cache()
+            await coordinator.async_request_refresh()
+
+    async def query_presence_history(call):
+        with_history = [scanner for scanner in scanners() if scanner.history is not None]
+        end = call.data.get(ATTR_END)
+        end = dt_util.as_timestamp(end) if end is not None else dt_util.utcnow().timestamp()
+        start = call.data.get(ATTR_START)
+        start = dt_util.as_timestamp(start) if start is not None else None
+        return await hass.async_add_executor_job(
+            _query_presence_history, with_history, call.data.get(ATTR_MAC), start, end)
+
+    def report_path(kind):
+        return hass.config.path(f"eero_tracker_{kind}_{dt_util.now().strftime('%Y%m%d_%H%M%S')}.txt")
+
+    def profile_scans(call):
+        path = report_path('profile')
+        try:
+            PROFILER.start(call.data[ATTR_MODE], call.data[ATTR_SCANS], path, defer=hass.add_job)
+        except RuntimeError as exception:
+            raise HomeAssistantError(str(exception)) from exception
+        return {'report': path}
+
+    async def memory_snapshot(call):
+        if call.data[ATTR_STOP]:
+            await hass.async_add_executor_job(MEMORY.stop)
+            return {}
+        state = {}
+        for index, scanner in enumerate(scanners()):
+            for name, value in scanner.diagnostics().items():
+                state[f"scanner {index} {name}"] = value
+        for coordinator in hass.data.get(DOMAIN, {}).get(DATA_COORDINATORS, {}).values():
+            state[f"{coordinator.entry.title} devices present"] = len(coordinator.snapshot)
+        path = report_path('memory')
+        await hass.async_add_executor_job(MEMORY.capture, path, state)
+        return {'report': path}
+
+    async def force_refresh(call):
+        for scanner in scanners():
+            await scanner.async_force_refresh()
+        for coordinator in hass.data.get(DOMAIN, {}).get(DATA_COORDINATORS, {}).values():
+            await coordinator.async_force_refresh()
+
+    async def shutdown(event):
+        for scanner in scanners():
+            await hass.async_add_executor_job(scanner.shutdown)
+
+    hass.services.async_register(DOMAIN, SERVICE_INVALIDATE_ACCOUNT_CACHE, invalidate_account_cache)
+    hass.services.async_register(DOMAIN, SERVICE_QUERY_PRESENCE_HISTORY, query_presence_history,
+                                 schema=QUERY_PRESENCE_HISTORY_SCHEMA, supports_response=SupportsResponse.ONLY)
+    hass.services.async_register(DOMAIN, SERVICE_PROFILE_SCANS, profile_scans,
+                                 schema=PROFILE_SCANS_SCHEMA, supports_response=SupportsResponse.OPTIONAL)
+    hass.services.async_register(DOMAIN, SERVICE_MEMORY_SNAPSHOT, memory_snapshot,
+                                 schema=MEMORY_SNAPSHOT_SCHEMA, supports_response=SupportsResponse.OPTIONAL)
+    hass.services.async_register(DOMAIN, SERVICE_FORCE_REFRESH, force_refresh)
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, shutdown)
+
+    hass.http.register_view(EeroMetricsView)
+    hass.async_create_task(async_load_platform(hass, Platform.SENSOR, DOMAIN, {}, config))
     return True
+
+
+async def async_setup_entry(hass, entry):
+    coordinator = EeroDataUpdateCoordinator(hass, entry)
+    # reading the session file and account cache is blocking I/O
+    await hass.async_add_executor_job(coordinator.load)
+    await coordinator.async_config_entry_first_refresh()
+
+    hass.data.setdefault(DOMAIN, {}).setdefault(DATA_COORDINATORS, {})[entry.entry_id] = coordinator
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    return True
+
+
+async def async_unload_entry(hass, entry):
+    unloaded = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    if unloaded:
+        hass.data[DOMAIN][DATA_COORDINATORS].pop(entry.entry_id)
+    return unloaded
@@ -0,0 +1,74 @@
+"""
+Persistent, stale-while-revalidate cache of the eero account's network list.
+
+The list is written next to the session file and loaded at startup, so scans
+never wait on the account endpoint after a restart. Once it expires the stale
+list keeps being served while a single background refresh replaces it.
+"""
+import logging
+import threading
+import time
+
+from .storage import read_json, write_json
+
+_LOGGER = logging.getLogger(__name__)
+
+CACHE_EXPIRY = 3600 # cache accounts for an hour
+
+
+class AccountCache(object):
+
+    def __init__(self, cache_file, expiry=CACHE_EXPIRY, clock=time.time):
+        self.cache_file = cache_file
+        self.expiry = expiry
+        self._clock = clock
+        self._networks = None
+        self._timestamp = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    @property
+    def networks(self):
+        """Cached network entries ({'url': ..., 'name': ...}), or None if nothing was ever cached"""
+        return self._networks
+
+    @property
+    def expired(self):
+        return self._timestamp is None or (self._clock() - self._timestamp) >= self.expiry
+
+    def load(self):
+        """Loads the cache persisted by a previous run; it keeps its original timestamp"""
+        data = read_json(self.cache_file)
+        if not data or not isinstance(data.get('networks'), list):
+            return False
+        self._networks = data['networks']
+        self._timestamp = data.get('timestamp')
+        _LOGGER.debug(f"Loaded {len(self._networks)} cached eero networks from {self.cache_file}")
+        return True
+
+    def update(self, account):
+        """Replaces the cache from an account response and persists it"""
+        networks = [dict(url=network['url'], name=network.get('name'))
+                    for network in account['networks']['data']]
+        self._networks = networks
+        self._timestamp = self._clock()
+        try:
+            write_json(self.cache_file, dict(timestamp=self._timestamp, networks=networks))
+        except (IOError, OSError):
+            _LOGGER.error(f"Could not write eero account cache {self.cache_file}")
+
+    def invalidate(self):
+        """Marks the cache expired; the cached list is still served until a refresh succeeds"""
+        self._timestamp = None
+
+    def begin_refresh(self):
+        """Returns True if the caller should refresh, False if a refresh is already running"""
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+            return True
+
+    def end_refresh(self):
+        with self._lock:
+            self._refreshing = False
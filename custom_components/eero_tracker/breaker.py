@@ -0,0 +1,106 @@
+"""
+Circuit breaker for the eero API, shared by every client of an API endpoint.
+
+After FAILURE_THRESHOLD consecutive outage failures (connection errors and
+timeouts, 429s and 5xx responses) the circuit opens and requests fail fast
+with ClientException(None, 'error.circuit_open') instead of tying up a worker
+thread each; scanners keep reporting the devices from their last good scan.
+Once RESET_TIMEOUT has passed a single probe request is let through
+(half-open): its success closes the circuit, its failure opens it again.
+"""
+import logging
+import threading
+import time
+
+from .metrics import CIRCUIT_REJECTED, CIRCUIT_STATE, METRICS
+from .transport import ClientException
+
+_LOGGER = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 60  # seconds the circuit stays open before a probe is let through
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+def is_outage(exception):
+    """Whether a failed request says eero is unreachable or overloaded, rather than rejecting the request"""
+    return exception.status is None or exception.status == 429 or exception.status >= 500
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT,
+                 clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probe_started = None
+
+    @property
+    def state(self):
+        return self._state
+
+    def before_request(self):
+        """Raises ClientException if the circuit is open; in half-open, lets exactly one probe through"""
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            now = self._clock()
+            if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+                self._probe_started = now
+                return
+            if self._state == HALF_OPEN and now - self._probe_started >= self.reset_timeout:
+                # the last probe never reported back (e.g. it was cancelled); send another
+                self._probe_started = now
+                return
+        METRICS.inc(CIRCUIT_REJECTED)
+        raise ClientException(None, 'error.circuit_open')
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._state != CLOSED:
+                self._set_state(CLOSED)
+                _LOGGER.warning(f"eero API {self.name} is reachable again; circuit closed")
+
+    def record_failure(self, exception):
+        """Counts exception against the circuit if it is an outage; other API errors count as a response"""
+        if not is_outage(exception):
+            self.record_success()
+            return
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = self._clock()
+                if self._state == CLOSED:
+                    _LOGGER.warning(f"eero API {self.name} failed {self._failures} times in a row "
+                                    f"({exception.error_message}); failing fast for {self.reset_timeout}s")
+                self._set_state(OPEN)
+
+    def _set_state(self, state):
+        self._state = state
+        METRICS.set(CIRCUIT_STATE, _STATE_VALUES[state])
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(api_endpoint):
+    """Returns the process-wide CircuitBreaker for an API endpoint, creating it on first use"""
+    with _breakers_lock:
+        breaker = _breakers.get(api_endpoint)
+        if breaker is None:
+            breaker = _breakers[api_endpoint] = CircuitBreaker(api_endpoint.split('{}')[0])
+        return breaker
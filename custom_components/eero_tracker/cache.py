@@ -0,0 +1,184 @@
+"""
+Process-wide response cache for eero API GETs.
+
+Responses are keyed by API endpoint, action, session token and parser, kept
+for a per-endpoint TTL and evicted least-recently-used. Identical requests
+that are already in flight are single-flighted: the first caller fetches and
+everyone arriving meanwhile waits for, and shares, its response (or error),
+whether they are threaded clients or async clients on the event loop.
+Cached responses are shared between callers, so treat them as read-only.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+from .metrics import METRICS, RESPONSE_CACHE, endpoint_label
+
+# seconds a response stays fresh, per endpoint label; anything else is only single-flighted
+ENDPOINT_TTLS = {
+    'account': 300,
+    'networks/{id}/devices': 10,  # below the 25 second scan floor, so each scan still sees fresh data
+}
+MAX_ENTRIES = 256
+
+
+def parser_key(parser):
+    """Hashable identity of a parser, so equal partial(parse_devices, fields=...) objects share entries"""
+    if isinstance(parser, partial):
+        return parser.func, parser.args, tuple(sorted(parser.keywords.items()))
+    return parser
+
+
+class _InFlight(object):
+    __slots__ = ('event', 'result', 'exception', 'task', 'loop')
+
+    def __init__(self, task=None, loop=None):
+        self.event = threading.Event()
+        self.result = None
+        self.exception = None
+        # set when an async client leads the fetch, so callers on its loop can await it directly
+        self.task = task
+        self.loop = loop
+
+
+class ResponseCache(object):
+
+    def __init__(self, ttls=None, max_entries=MAX_ENTRIES, clock=time.monotonic):
+        self.ttls = dict(ENDPOINT_TTLS if ttls is None else ttls)
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires at, response), oldest use first
+        self._in_flight = {}           # key -> _InFlight
+
+    @staticmethod
+    def key(api_endpoint, action, session, parser=None):
+        return api_endpoint, action, session, parser_key(parser)
+
+    def ttl(self, action):
+        return self.ttls.get(endpoint_label(action), 0)
+
+    def lookup(self, key):
+        """The fresh cached response for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        METRICS.inc(RESPONSE_CACHE, endpoint=endpoint_label(key[1]), result='hit')
+        return entry[1]
+
+    def store(self, key, response):
+        ttl = self.ttl(key[1])
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_fetch(self, key, fetch):
+        """Returns the cached response for key, joins an identical in-flight fetch, or calls fetch()"""
+        cached = self.lookup(key)
+        if cached is not None:
+            return cached
+
+        endpoint = endpoint_label(key[1])
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _InFlight()
+
+        if not leader:
+            METRICS.inc(RESPONSE_CACHE, endpoint=endpoint, result='coalesced')
+            flight.event.wait()
+            if flight.exception is not None:
+                raise flight.exception
+            return flight.result
+
+        METRICS.inc(RESPONSE_CACHE, endpoint=endpoint, result='miss')
+        try:
+            flight.result = fetch()
+            self.store(key, flight.result)
+            return flight.result
+        except BaseException as exception:
+            flight.exception = exception
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            flight.event.set()
+
+    async def get_or_fetch_async(self, key, fetch):
+        """Like get_or_fetch, for callers on an event loop; fetch() returns an awaitable"""
+        cached = self.lookup(key)
+        if cached is not None:
+            return cached
+
+        endpoint = endpoint_label(key[1])
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _InFlight(loop=loop)
+
+        if leader:
+            METRICS.inc(RESPONSE_CACHE, endpoint=endpoint, result='miss')
+            # runs as its own task so a cancelled caller does not cancel the fetch for everyone else
+            flight.task = asyncio.ensure_future(fetch())
+            flight.task.add_done_callback(partial(self._finish_async, key, flight))
+        else:
+            METRICS.inc(RESPONSE_CACHE, endpoint=endpoint, result='coalesced')
+            if flight.task is None or flight.loop is not loop:
+                # led by a threaded client (or another loop); wait for it without blocking this loop
+                await loop.run_in_executor(None, flight.event.wait)
+                if flight.exception is not None:
+                    raise flight.exception
+                return flight.result
+        return await asyncio.shield(flight.task)
+
+    def _finish_async(self, key, flight, task):
+        if task.cancelled():
+            flight.exception = asyncio.CancelledError()
+        elif task.exception() is not None:
+            flight.exception = task.exception()
+        else:
+            flight.result = task.result()
+            self.store(key, flight.result)
+        with self._lock:
+            if self._in_flight.get(key) is flight:
+                del self._in_flight[key]
+        flight.event.set()
+
+    def invalidate(self, action=None):
+        """Drops cached responses for one action (e.g. 'account'), or all of them"""
+        with self._lock:
+            if action is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[1] == action]:
+                del self._entries[key]
+
+    def clear(self):
+        self.invalidate()
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def shared_cache():
+    """Returns the process-wide ResponseCache, creating it on first use"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
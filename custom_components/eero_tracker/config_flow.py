@@ -1,15 +1,17 @@
 import logging
 import voluptuous as vol
 
-from collections import OrderedDict
 from homeassistant import config_entries
+from homeassistant.util import slugify
 
 from .const import (
+    CONF_SESSION_FILE_NAME,
     DOMAIN,
     EERO_SESSION_COOKIE_FILE,
 )
 
 from .eero import (
+    ClientException,
     CookieStore,
     Eero,
 )
@@ -20,36 +22,65 @@ _LOGGER = logging.getLogger(__name__)
 class EeroFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
 
     def __init__(self):
-        self.session = CookieStore(EERO_SESSION_COOKIE_FILE)
-        self.eero = Eero(self.session)
+        self.eero = None
+        self.session_file_name = None
         self.token = None
         self.username = None
 
         self.user_step_schema = vol.Schema({ vol.Required("username"): str })
         self.verify_step_schema = vol.Schema({ vol.Required("verification_code"): str })
 
+    def _session_file_name(self):
+        # the first account keeps eero.session, so the CLI and YAML setups can share it
+        used = {entry.data.get(CONF_SESSION_FILE_NAME) for entry in self._async_current_entries()}
+        if EERO_SESSION_COOKIE_FILE not in used:
+            return EERO_SESSION_COOKIE_FILE
+        return f"eero.{slugify(self.username)}.session"
+
     async def async_step_user(self, user_input=None):
-        _LOGGER.debug("Handle user step with input", user_input)
+        _LOGGER.debug("Starting login flow")
+        errors = {}
         if user_input is not None:
             self.username = user_input["username"]
-            _LOGGER.debug("Starting login for user", self.username)
             await self.async_set_unique_id(self.username)
-            self.token = self.eero.login(self.username)
-            _LOGGER.debug("Retrieved token", self.token)
-            return self.async_show_form(
-                step_id="verify", data_schema=self.verify_step_schema
-            )
+            self._abort_if_unique_id_configured()
+
+            # requests and the session file are blocking, so all of it runs in the executor
+            self.session_file_name = self._session_file_name()
+            session = await self.hass.async_add_executor_job(
+                CookieStore, self.hass.config.path(self.session_file_name))
+            self.eero = Eero(session)
+            try:
+                self.token = await self.hass.async_add_executor_job(self.eero.login, self.username)
+            except ClientException as exception:
+                _LOGGER.error(f"eero login failed: {exception.error_message}")
+                errors["base"] = "cannot_connect" if exception.status is None else "invalid_auth"
+            else:
+                return self.async_show_form(
+                    step_id="verify", data_schema=self.verify_step_schema
+                )
 
-        _LOGGER.debug("Starting login flow")
         return self.async_show_form(
-            step_id="user", data_schema=self.user_step_schema
+            step_id="user", data_schema=self.user_step_schema, errors=errors
         )
 
     async def async_step_verify(self, user_input=None):
-        _LOGGER.debug("Verifiying user")
-        self.eero.login_verify(user_input["verification_code"], self.token)
-        _LOGGER.debug("Verification successful")
-        return self.async_create_entry(
-            title=f"Eero - {self.username}",
-            data={"username": self.username}
+        _LOGGER.debug("Verifying user")
+        errors = {}
+        if user_input is not None:
+            try:
+                await self.hass.async_add_executor_job(
+                    self.eero.login_verify, user_input["verification_code"], self.token)
+            except ClientException as exception:
+                _LOGGER.error(f"eero verification failed: {exception.error_message}")
+                errors["base"] = "cannot_connect" if exception.status is None else "invalid_code"
+            else:
+                _LOGGER.debug("Verification successful")
+                return self.async_create_entry(
+                    title=f"Eero - {self.username}",
+                    data={"username": self.username, CONF_SESSION_FILE_NAME: self.session_file_name}
+                )
+
+        return self.async_show_form(
+            step_id="verify", data_schema=self.verify_step_schema, errors=errors
         )
@@ -1,2 +1,23 @@
 DOMAIN = "eero_tracker"
 EERO_SESSION_COOKIE_FILE = "eero.session"
+
+DATA_SCANNERS = "scanners"
+DATA_COORDINATORS = "coordinators"
+
+CONF_SESSION_FILE_NAME = "session_file_name"
+
+MINIMUM_SCAN_INTERVAL = 25
+DEFAULT_MAX_SCAN_INTERVAL = 120 # quiet networks back off to this
+
+SERVICE_INVALIDATE_ACCOUNT_CACHE = "invalidate_account_cache"
+SERVICE_QUERY_PRESENCE_HISTORY = "query_presence_history"
+SERVICE_PROFILE_SCANS = "profile_scans"
+SERVICE_MEMORY_SNAPSHOT = "memory_snapshot"
+SERVICE_FORCE_REFRESH = "force_refresh"
+
+ATTR_MAC = "mac"
+ATTR_START = "start"
+ATTR_END = "end"
+ATTR_SCANS = "scans"
+ATTR_MODE = "mode"
+ATTR_STOP = "stop"
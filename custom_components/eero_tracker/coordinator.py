@@ -0,0 +1,79 @@
+"""
+Config-entry coordinator: one eero fetch per interval, shared by every entity.
+
+The coordinator polls the entry's account through the same AccountPoller the
+multi-account poller uses (shared connection pool, fair worker pool, adaptive
+per-network schedule, persistent account cache and presence registry). All of
+that is blocking code, so it only ever runs in the executor. Entities read the
+registry's published snapshot and are told which MACs changed, so only those
+write state.
+"""
+import logging
+from datetime import timedelta
+
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+
+from .cache import shared_cache
+from .const import (
+    CONF_SESSION_FILE_NAME,
+    DEFAULT_MAX_SCAN_INTERVAL,
+    DOMAIN,
+    EERO_SESSION_COOKIE_FILE,
+    MINIMUM_SCAN_INTERVAL,
+)
+from .filters import DeviceFilter
+from .poller import MultiAccountPoller
+from .profiling import PROFILER
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class EeroDataUpdateCoordinator(DataUpdateCoordinator):
+    """Polls one eero account; data is the PresenceDiff of the latest poll"""
+
+    def __init__(self, hass, entry):
+        super().__init__(hass, _LOGGER, name=f"{DOMAIN} {entry.title}",
+                         update_interval=timedelta(seconds=MINIMUM_SCAN_INTERVAL))
+        self.entry = entry
+        self.session_file = hass.config.path(entry.data.get(CONF_SESSION_FILE_NAME, EERO_SESSION_COOKIE_FILE))
+        self.poller = MultiAccountPoller(min_interval=MINIMUM_SCAN_INTERVAL, max_interval=DEFAULT_MAX_SCAN_INTERVAL)
+        self.account = None
+        self.changed_macs = frozenset()
+
+    def load(self):
+        """Reads the session file and cached network list; blocking, so run it in the executor"""
+        self.account = self.poller.add_account(self.entry.entry_id, self.session_file, DeviceFilter())
+
+    @property
+    def snapshot(self):
+        """The ScanSnapshot of the last completed poll; safe to read on the event loop while a poll runs"""
+        return self.account.registry.current
+
+    async def _async_update_data(self):
+        if self.account.eero.needs_login():
+            raise UpdateFailed(f"No eero session in {self.session_file}; add the integration again to log in")
+
+        diff = (await self.hass.async_add_executor_job(self._poll))[self.entry.entry_id]
+        if self.account.account_cache.networks is None:
+            raise UpdateFailed("Could not load the eero account's networks")
+
+        self.changed_macs = frozenset([record.mac for record in diff.joined] +
+                                      [record.mac for record in diff.left] +
+                                      [record.mac for record, _ in diff.renamed])
+        return diff
+
+    async def async_force_refresh(self):
+        """Refetches the account and every network now, bypassing all caches"""
+        shared_cache().clear()
+        self.account.scheduler.reset()
+        # polls only revalidate an expired network list in the background; this one waits for it
+        await self.hass.async_add_executor_job(self.account.refresh_networks)
+        await self.async_refresh()
+
+    def _poll(self):
+        with PROFILER.scan():
+            return self.poller.poll()
+
+    def invalidate_account_cache(self):
+        self.account.account_cache.invalidate()
+        shared_cache().invalidate('account')
@@ -0,0 +1,369 @@
+"""
+Local poller daemon: one process owns an eero session and its polling loop,
+and fans presence out to any number of subscribers over a Unix socket.
+
+However many consumers are attached (device_tracker scanners, the
+eero_tracker_instantiate.py CLI, scripts), eero sees a single client
+polling on one schedule, and only the daemon ever refreshes the session.
+
+Every frame is a 5 byte header (payload length as a big-endian uint32, then
+the frame type) followed by a compact JSON payload. Devices are sent as
+[mac, nickname, hostname, network_id, wireless, node, band] entries.
+
+    S  snapshot  {"version", "seq", "ts", "networks", "devices": [entry, ...]}
+                 sent once to each subscriber as it connects
+    D  delta     {"seq", "ts", "networks", "polled", "set": [entry, ...], "del": [mac, ...]}
+                 sent to every subscriber after each poll, even an unchanged one
+
+The daemon tracks every connected device (wired ones too) without hysteresis;
+subscribers apply their own filters and debouncing. Frames are encoded once
+per poll. A subscriber that falls too far behind is disconnected and gets a
+fresh snapshot when it reconnects.
+"""
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+from .filters import DeviceFilter
+from .poller import MultiAccountPoller
+from .presence import EMPTY_SNAPSHOT
+from .transport import Transport, shared_transport
+
+_LOGGER = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = 1
+FRAME_HEADER = struct.Struct('>IB')
+FRAME_SNAPSHOT = ord('S')
+FRAME_DELTA = ord('D')
+MAX_FRAME = 16 * 1024 * 1024
+MAX_QUEUED_FRAMES = 64  # per subscriber, before it is disconnected as too slow
+RECONNECT_DELAY = 5  # seconds between a subscriber's attempts to reach the daemon
+DAEMON_ACCOUNT = 'daemon'
+
+
+def encode_frame(kind, payload):
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return FRAME_HEADER.pack(len(body), kind) + body
+
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) < size:
+        raise EOFError('eero_tracker daemon connection closed')
+    return data
+
+
+def read_frame(stream):
+    """Reads one frame from a binary stream (e.g. socket.makefile('rb')), returning (kind, payload)"""
+    size, kind = FRAME_HEADER.unpack(_read_exactly(stream, FRAME_HEADER.size))
+    if size > MAX_FRAME:
+        raise ValueError(f"eero_tracker daemon frame of {size} bytes is too large")
+    return kind, json.loads(_read_exactly(stream, size))
+
+
+def snapshot_delta(previous, current):
+    """(entries added or changed, macs removed) between two ScanSnapshots"""
+    if current is previous:
+        return [], []
+    changed = [list(state) for mac, state in current.devices.items() if previous.devices.get(mac) != state]
+    removed = [mac for mac in previous.devices if mac not in current.devices]
+    return changed, removed
+
+
+class _Subscriber(object):
+    """A connected client with its own outgoing queue, so one slow reader never holds up the others"""
+
+    def __init__(self, connection, on_close):
+        self._connection = connection
+        self._on_close = on_close
+        self._frames = deque()
+        self._ready = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='eero_tracker_daemon_subscriber', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def offer(self, frame):
+        """Queues a frame; returns False (and closes) if the subscriber is too far behind"""
+        with self._ready:
+            if self._closed:
+                return False
+            if len(self._frames) >= MAX_QUEUED_FRAMES:
+                _LOGGER.warning("Disconnecting an eero_tracker daemon subscriber that stopped reading")
+                self._close()
+                return False
+            self._frames.append(frame)
+            self._ready.notify()
+            return True
+
+    def close(self):
+        with self._ready:
+            self._close()
+
+    def _close(self):
+        self._closed = True
+        self._ready.notify()
+        # a sender blocked in sendall() on a client that stopped reading only wakes up once the socket is shut down
+        try:
+            self._connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _run(self):
+        try:
+            while True:
+                with self._ready:
+                    while not self._frames and not self._closed:
+                        self._ready.wait()
+                    if self._closed:
+                        return
+                    frame = self._frames.popleft()
+                self._connection.sendall(frame)
+        except OSError:
+            pass
+        finally:
+            self._connection.close()
+            self._on_close(self)
+
+
+class PollerDaemon(object):
+    """Polls one account and publishes every poll to the subscribers on socket_path"""
+
+    def __init__(self, socket_path, session_file, interval=25, max_interval=120, api_endpoint=None):
+        self.socket_path = socket_path
+        self.interval = interval
+        transport = shared_transport() if api_endpoint is None else Transport(api_endpoint)
+        self.poller = MultiAccountPoller(transport=transport, min_interval=interval, max_interval=max_interval)
+        self.account = self.poller.add_account(DAEMON_ACCOUNT, session_file, DeviceFilter(only_wireless=False))
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._snapshot = EMPTY_SNAPSHOT
+        self._snapshot_frame = None  # encoded lazily, only when someone connects
+        self._networks = []
+        self._sequence = 0
+        self._server = None
+        self._stop = threading.Event()
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def bind(self):
+        """Listens on socket_path, replacing a stale socket file left by a daemon that died"""
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                os.unlink(self.socket_path)
+            else:
+                raise RuntimeError(f"An eero_tracker daemon is already serving {self.socket_path}")
+            finally:
+                probe.close()
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.socket_path)
+        # only the owner may read presence (or ask anything of the session owner)
+        os.chmod(self.socket_path, 0o600)
+        self._server.listen()
+        threading.Thread(target=self._accept, name='eero_tracker_daemon_accept', daemon=True).start()
+
+    def serve_forever(self):
+        if self._server is None:
+            self.bind()
+        _LOGGER.info(f"eero_tracker daemon polling every {self.interval}s, serving {self.socket_path}")
+        try:
+            while not self._stop.is_set():
+                started = time.monotonic()
+                self.poll_once()
+                self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+        finally:
+            self.close()
+
+    def stop(self):
+        self._stop.set()
+
+    def poll_once(self):
+        """Polls every due network once and publishes the result to every subscriber"""
+        self.poller.poll()
+        snapshot = self.account.registry.current
+        changed, removed = snapshot_delta(self._snapshot, snapshot)
+        with self._lock:
+            self._sequence += 1
+            self._networks = list(self.account.network_ids)
+            frame = encode_frame(FRAME_DELTA, {
+                'seq': self._sequence, 'ts': time.time(), 'networks': self._networks,
+                'polled': list(self.account.polled), 'set': changed, 'del': removed,
+            })
+            if snapshot is not self._snapshot:
+                self._snapshot = snapshot
+                self._snapshot_frame = None
+            for subscriber in list(self._subscribers):
+                if not subscriber.offer(frame):
+                    self._subscribers.discard(subscriber)
+
+    def _accept(self):
+        while not self._stop.is_set():
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                return
+            subscriber = _Subscriber(connection, self._remove)
+            with self._lock:
+                # queued under the lock, so the snapshot always precedes the deltas that follow it
+                if self._snapshot_frame is None:
+                    self._snapshot_frame = encode_frame(FRAME_SNAPSHOT, {
+                        'version': PROTOCOL_VERSION, 'seq': self._sequence, 'ts': self._snapshot.timestamp,
+                        'networks': self._networks, 'devices': self._snapshot.entries(),
+                    })
+                subscriber.offer(self._snapshot_frame)
+                self._subscribers.add(subscriber)
+            subscriber.start()
+
+    def _remove(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def close(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, set()
+        for subscriber in subscribers:
+            subscriber.close()
+
+
+class DaemonSubscriber(object):
+    """Mirrors a PollerDaemon's presence in the background, reconnecting whenever it goes away.
+
+    listener, if given, is called from the subscriber thread with a list of
+    (change, entry, previous entry) tuples for every frame, change being
+    'joined', 'left' or 'changed'.
+    """
+
+    def __init__(self, socket_path, listener=None, reconnect_delay=RECONNECT_DELAY):
+        self.socket_path = socket_path
+        self._listener = listener
+        self._reconnect_delay = reconnect_delay
+        self._lock = threading.Lock()
+        self._devices = None  # mac -> entry; None until the first snapshot
+        self._networks = []
+        self._polled = set()  # networks polled since the last take()
+        self._connection = None
+        self._stop = threading.Event()
+        self._synced = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='eero_tracker_daemon_client', daemon=True)
+        self.sequence = None
+
+    @property
+    def connected(self):
+        return self._connection is not None
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wait_synced(self, timeout=None):
+        """Blocks until the first snapshot has been received; returns whether it was"""
+        return self._synced.wait(timeout)
+
+    def stop(self):
+        self._stop.set()
+        connection = self._connection
+        if connection is not None:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def take(self):
+        """(network ids, {network_id: [entry]}, networks polled since the last take), or None before the first snapshot.
+
+        While the daemon is unreachable the last known devices are returned with nothing polled.
+        """
+        with self._lock:
+            if self._devices is None:
+                return None
+            by_network = {}
+            for entry in self._devices.values():
+                by_network.setdefault(entry[3], []).append(entry)
+            polled, self._polled = self._polled, set()
+            return list(self._networks), by_network, polled
+
+    def _run(self):
+        warned = False
+        while not self._stop.is_set():
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                connection.connect(self.socket_path)
+            except OSError as exception:
+                connection.close()
+                if not warned:
+                    _LOGGER.warning(f"Could not reach the eero_tracker daemon at {self.socket_path}: {exception}")
+                    warned = True
+                self._stop.wait(self._reconnect_delay)
+                continue
+
+            warned = False
+            self._connection = connection
+            _LOGGER.info(f"Attached to the eero_tracker daemon at {self.socket_path}")
+            try:
+                with connection.makefile('rb') as stream:
+                    while not self._stop.is_set():
+                        self._apply(*read_frame(stream))
+            except (EOFError, OSError, ValueError) as exception:
+                if not self._stop.is_set():
+                    _LOGGER.warning(f"Lost the eero_tracker daemon at {self.socket_path} ({exception!r}); "
+                                    f"keeping the last known devices")
+            finally:
+                self._connection = None
+                connection.close()
+            self._stop.wait(self._reconnect_delay)
+
+    def _apply(self, kind, payload):
+        events = []
+        with self._lock:
+            previous = self._devices or {}
+            if kind == FRAME_SNAPSHOT:
+                if payload.get('version') != PROTOCOL_VERSION:
+                    raise ValueError(f"unsupported eero_tracker daemon protocol {payload.get('version')}")
+                self._devices = {entry[0]: entry for entry in payload['devices']}
+                # a fresh snapshot stands in for a poll of every network
+                self._polled.update(self._networks, payload['networks'])
+                if self._listener is not None:
+                    events += [('left', None, entry) for mac, entry in previous.items() if mac not in self._devices]
+                    events += [('joined' if entry[0] not in previous else 'changed', entry, previous.get(entry[0]))
+                               for entry in self._devices.values() if previous.get(entry[0]) != entry]
+            elif kind == FRAME_DELTA and self._devices is not None:
+                for mac in payload['del']:
+                    entry = self._devices.pop(mac, None)
+                    if entry is not None:
+                        events.append(('left', None, entry))
+                for entry in payload['set']:
+                    before = self._devices.get(entry[0])
+                    self._devices[entry[0]] = entry
+                    events.append(('joined' if before is None else 'changed', entry, before))
+                self._polled.update(payload['polled'])
+                # networks dropped from the account count as polled, so their devices leave
+                self._polled.update(set(self._networks) - set(payload['networks']))
+            else:
+                return
+            self._networks = payload['networks']
+            self.sequence = payload['seq']
+        self._synced.set()
+        if self._listener is not None and events:
+            try:
+                self._listener(events)
+            except Exception:
+                _LOGGER.exception("Error in eero_tracker daemon listener")
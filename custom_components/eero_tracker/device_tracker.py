@@ -6,32 +6,107 @@ For instructions and examples, see https://github.com/jrlucier/eero_tracker
 import logging
 import voluptuous as vol
 import datetime
-import time
 import re
-import json
-import requests
+import time
 import homeassistant.helpers.config_validation as cv
+from homeassistant.core import callback
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant.components.device_tracker.legacy import DeviceScanner
-from homeassistant.components.device_tracker import PLATFORM_SCHEMA
+from homeassistant.components.device_tracker import PLATFORM_SCHEMA, ScannerEntity, SourceType
 from homeassistant.components.device_tracker.const import (
            DOMAIN, CONF_SCAN_INTERVAL)
 
+from .cache import shared_cache
+from .const import (
+    CONF_SESSION_FILE_NAME,
+    DATA_COORDINATORS,
+    DATA_SCANNERS,
+    DEFAULT_MAX_SCAN_INTERVAL,
+    DOMAIN as EERO_DOMAIN,
+    MINIMUM_SCAN_INTERVAL,
+)
+from .eero import API_ENDPOINT, AsyncClient, Client, ClientException
+from .metrics import (
+    DEVICES_LAST_SCAN,
+    METRICS,
+    SCAN_DURATION,
+    SCANS,
+    SESSION_REFRESH_DURATION,
+    SESSION_REFRESHES,
+)
+from .filters import DeviceFilter, mac_to_int, parse_mac_prefix, split_list
+from .daemon import DaemonSubscriber
+from .history import DEFAULT_RETENTION_DAYS, PresenceHistory
+from .parser import parse_devices
+from .poller import AccountPoller, shared_async_scheduler, shared_pool
+from .ratelimit import RateLimiter
+from .profiling import PROFILER
+from .presence import PresenceDiff, PresenceHysteresis
+from .session import SessionManager
+from .storage import read_json, sibling_path, write_json
+
 _LOGGER = logging.getLogger(__name__)
 
 CONF_ONLY_MACS_KEY = 'only_macs'
 CONF_ONLY_NETWORKS = 'only_networks'
 CONF_ONLY_WIRELESS = 'only_wireless'
-CONF_SESSION_FILE_NAME = 'session_file_name'
-
-MINIMUM_SCAN_INTERVAL = 25
-
-CACHE_EXPIRY=3600 # cache accounts for an hour
+CONF_EXCLUDE_MACS = 'exclude_macs'
+CONF_ONLY_MAC_PREFIXES = 'only_mac_prefixes'
+CONF_EXCLUDE_MAC_PREFIXES = 'exclude_mac_prefixes'
+CONF_ONLY_HOSTNAMES = 'only_hostnames'
+CONF_EXCLUDE_HOSTNAMES = 'exclude_hostnames'
+CONF_MAX_SCAN_INTERVAL = 'max_interval_seconds'
+CONF_HISTORY_DAYS = 'history_days'
+CONF_JOIN_POLLS = 'join_polls'
+CONF_LEAVE_POLLS = 'leave_polls'
+CONF_LEAVE_SECONDS = 'leave_seconds'
+CONF_MAX_REQUESTS_PER_MINUTE = 'max_requests_per_minute'
+CONF_REQUEST_BURST = 'request_burst'
+CONF_DAEMON_SOCKET = 'daemon_socket'
+
+MAX_CONCURRENT_REQUESTS = 4 # network device lists fetched in parallel by the async scanner
+
+WARM_START_MAX_AGE = 1800 # seconds; older snapshots are ignored, devices may have left meanwhile
+SNAPSHOT_INTERVAL = 300 # seconds between snapshot writes while nothing changes
+
+def _mac_list(value):
+    """Comma separated string or list of MAC addresses, in any common notation"""
+    macs = split_list(value)
+    for mac in macs:
+        if mac_to_int(mac) is None:
+            raise vol.Invalid(f"Invalid MAC address: {mac}")
+    return macs
+
+def _mac_prefix_list(value):
+    """Comma separated string or list of MAC prefixes (e.g. vendor OUIs like 00:17:88)"""
+    prefixes = split_list(value)
+    for prefix in prefixes:
+        try:
+            parse_mac_prefix(prefix)
+        except ValueError as exception:
+            raise vol.Invalid(str(exception))
+    return prefixes
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
-    vol.Optional(CONF_ONLY_MACS_KEY, default=''): cv.string,
+    vol.Optional(CONF_ONLY_MACS_KEY, default=''): _mac_list,
+    vol.Optional(CONF_EXCLUDE_MACS, default=''): _mac_list,
+    vol.Optional(CONF_ONLY_MAC_PREFIXES, default=[]): _mac_prefix_list,
+    vol.Optional(CONF_EXCLUDE_MAC_PREFIXES, default=[]): _mac_prefix_list,
+    vol.Optional(CONF_ONLY_HOSTNAMES, default=[]): vol.All(split_list, [cv.string]),
+    vol.Optional(CONF_EXCLUDE_HOSTNAMES, default=[]): vol.All(split_list, [cv.string]),
     vol.Optional(CONF_ONLY_NETWORKS, default=[]): vol.All(cv.ensure_list, [cv.positive_int]),
     vol.Optional(CONF_ONLY_WIRELESS, default=True): cv.boolean, 
-    vol.Optional(CONF_SESSION_FILE_NAME, default='eero.session'): cv.string
+    vol.Optional(CONF_SESSION_FILE_NAME, default='eero.session'): cv.string,
+    vol.Optional(CONF_MAX_SCAN_INTERVAL, default=DEFAULT_MAX_SCAN_INTERVAL): cv.positive_int,
+    vol.Optional(CONF_HISTORY_DAYS, default=DEFAULT_RETENTION_DAYS): cv.positive_int,
+    vol.Optional(CONF_JOIN_POLLS, default=1): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    vol.Optional(CONF_LEAVE_POLLS, default=1): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    vol.Optional(CONF_LEAVE_SECONDS, default=0): cv.positive_int,
+    vol.Optional(CONF_MAX_REQUESTS_PER_MINUTE): cv.positive_int,
+    vol.Optional(CONF_REQUEST_BURST): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    vol.Optional(CONF_DAEMON_SOCKET): cv.string,
 })
 
 def get_scanner(hass, config):
@@ -40,41 +115,131 @@ def get_scanner(hass, config):
     _LOGGER.debug(f"Initializing eero_tracker (domain {DOMAIN})")
     return EeroDeviceScanner(hass, config[DOMAIN])
 
-class EeroException(Exception):
-    """A propagating error for Eero"""
+async def async_get_scanner(hass, config):
+    """Validate the configuration and return EeroDeviceScanner, scanning on the event loop."""
+
+    _LOGGER.debug(f"Initializing async eero_tracker (domain {DOMAIN})")
+    # the constructor reads the session file, so keep it off the event loop
+    return await hass.async_add_executor_job(EeroDeviceScanner, hass, config[DOMAIN])
+
+async def async_setup_entry(hass, entry, async_add_entities):
+    """Adds an entity per device seen on the entry's account, as devices first appear"""
+    coordinator = hass.data[EERO_DOMAIN][DATA_COORDINATORS][entry.entry_id]
+    tracked = set()
+
+    @callback
+    def add_entities(macs):
+        new = [mac for mac in macs if mac not in tracked]
+        if new:
+            tracked.update(new)
+            async_add_entities([EeroScannerEntity(coordinator, mac) for mac in new])
+
+    # devices tracked before a restart come back right away, even while away
+    add_entities([registry_entry.unique_id
+                  for registry_entry in er.async_entries_for_config_entry(er.async_get(hass), entry.entry_id)
+                  if registry_entry.domain == DOMAIN])
+    add_entities(coordinator.snapshot.macs)
+    entry.async_on_unload(coordinator.async_add_listener(lambda: add_entities(coordinator.snapshot.macs)))
+
+
+class EeroScannerEntity(CoordinatorEntity, ScannerEntity):
+    """A device on the eero account, present while the coordinator's latest snapshot has it"""
+
+    def __init__(self, coordinator, mac):
+        super().__init__(coordinator)
+        self._mac = mac
+        self._hostname = None
+        self._nickname = None
+        self._remember()
+
+    def _remember(self):
+        # keep the last known names for while the device is away
+        state = self.coordinator.snapshot.get(self._mac)
+        if state is not None:
+            self._hostname = state.hostname
+            self._nickname = state.nickname
+
+    @callback
+    def _handle_coordinator_update(self):
+        # only devices that joined, left or were renamed write state
+        if self._mac in self.coordinator.changed_macs:
+            self._remember()
+            self.async_write_ha_state()
+
+    @property
+    def name(self):
+        return self._nickname or self._hostname or self._mac
+
+    @property
+    def source_type(self):
+        return SourceType.ROUTER
+
+    @property
+    def is_connected(self):
+        return self._mac in self.coordinator.snapshot
+
+    @property
+    def mac_address(self):
+        return self._mac
+
+    @property
+    def hostname(self):
+        return self._hostname
 
-    def __init__(self, status, error_message):
-        super(EeroException, self).__init__()
-        self.status = status
-        self.error_message = error_message
+# kept as an alias so existing references continue to work; the shared
+# transport raises ClientException for every API error
+EeroException = ClientException
 
 
 class EeroDeviceScanner(DeviceScanner):
     """This class queries a Eero-based router for present devices."""
 
-    API_ENDPOINT = 'https://api-user.e2ro.com/2.2/{}'
+    API_ENDPOINT = API_ENDPOINT
 
     def __init__(self, hass, config):
         """Initialize the scanner."""
+        self.__hass = hass
+        self.__async_client = None
+        self.__client = Client(api_endpoint=self.API_ENDPOINT)
         self.__session_file = hass.config.path(config[CONF_SESSION_FILE_NAME])
-        self.__session = None
-        
-        # configure any filters (macs or networks)
-        self.__only_macs = set([x.strip().lower() for x in config[CONF_ONLY_MACS_KEY].split(',') if x != ''])
-        if len(self.__only_macs) > 0:
-            _LOGGER.info(f"Including only MAC addresses: {self.__only_macs}")
-
-        self.__only_networks = set(config[CONF_ONLY_NETWORKS])
-        if len(self.__only_networks) > 0:
-            _LOGGER.info(f"Including only networks: {self.__only_networks}")
 
-        self.__only_wireless = config[CONF_ONLY_WIRELESS]
-        _LOGGER.info(f"Tracking only wireless devices = {self.__only_wireless}")
-
-        self.__last_results = []
-        self.__account = None
-        self.__account_update_timestamp = None
-        self.__mac_to_nickname = {}
+        # every process polling this account draws from one request budget (0 = unlimited);
+        # left unset, the account keeps whatever budget its other users configured
+        self.__rate_limiter = RateLimiter.for_file(
+            self.__session_file, config.get(CONF_MAX_REQUESTS_PER_MINUTE), config.get(CONF_REQUEST_BURST))
+        self.__client.rate_limiter = self.__rate_limiter
+        shared_pool().set_limiter(self.__session_file, self.__rate_limiter)
+        
+        # configure any filters (macs, prefixes, hostnames or networks), compiled once
+        self.__filter = DeviceFilter(
+            only_macs=split_list(config.get(CONF_ONLY_MACS_KEY)),
+            exclude_macs=split_list(config.get(CONF_EXCLUDE_MACS)),
+            only_mac_prefixes=split_list(config.get(CONF_ONLY_MAC_PREFIXES)),
+            exclude_mac_prefixes=split_list(config.get(CONF_EXCLUDE_MAC_PREFIXES)),
+            only_hostnames=split_list(config.get(CONF_ONLY_HOSTNAMES)),
+            exclude_hostnames=split_list(config.get(CONF_EXCLUDE_HOSTNAMES)),
+            only_networks=config.get(CONF_ONLY_NETWORKS, []),
+            only_wireless=config.get(CONF_ONLY_WIRELESS, True))
+        _LOGGER.info(f"Device filters: {self.__filter.describe()}")
+
+        if len(self.__filter.only_networks) > 0:
+            _LOGGER.info(f"Including only networks: {set(self.__filter.only_networks)}")
+
+        _LOGGER.info(f"Tracking only wireless devices = {self.__filter.only_wireless}")
+
+        self.__hysteresis = PresenceHysteresis(config.get(CONF_JOIN_POLLS, 1), config.get(CONF_LEAVE_POLLS, 1),
+                                               config.get(CONF_LEAVE_SECONDS, 0))
+        if self.__hysteresis.enabled:
+            _LOGGER.info(f"Devices join after {self.__hysteresis.join_polls} polls and leave after "
+                         f"{self.__hysteresis.leave_polls} missed polls (or {self.__hysteresis.leave_seconds}s "
+                         f"since eero last saw them active)")
+        self.__last_diff = PresenceDiff()
+        self.__diff_listeners = []
+
+        # joins and departures are logged next to the session file; 0 days turns the log off
+        history_days = config.get(CONF_HISTORY_DAYS, DEFAULT_RETENTION_DAYS)
+        self.__history = (PresenceHistory(sibling_path(self.__session_file, 'history.db'), history_days)
+                          if history_days else None)
 
         minimum_interval = datetime.timedelta(seconds=MINIMUM_SCAN_INTERVAL)
         self.__scan_interval = config.get(CONF_SCAN_INTERVAL, minimum_interval)
@@ -87,124 +252,399 @@ class EeroDeviceScanner(DeviceScanner):
         else:
             _LOGGER.debug(f"Scan interval = {self.__scan_interval}")
 
-        # Grab the session key from the file
-        try:
-            _LOGGER.debug(f"Loading eero session key from '{self.__session_file}'")
-            with open(self.__session_file, 'r') as f:
-                self.__session = f.read().replace('\n', '')
-        except IOError:
+        # each network is polled on its own schedule between the scan interval and this maximum.
+        # The network list, schedules and presence are kept by an AccountPoller, as in the poller
+        # daemon; it serves the network list from the last run while it is revalidated in the background
+        max_interval = config.get(CONF_MAX_SCAN_INTERVAL, DEFAULT_MAX_SCAN_INTERVAL)
+        self.__account = AccountPoller(self.__session_file, self.__session_file, self.__client, self.__filter,
+                                       self.__scan_interval.total_seconds(), max_interval, self.__hysteresis)
+        self.__registry = self.__account.registry
+        _LOGGER.debug(f"Quiet networks back off to at most {self.__account.scheduler.max_interval} seconds")
+
+        # Grab the session key from the file; the manager is shared with anything else
+        # in this process using the same file, so refreshes are only done once
+        _LOGGER.debug(f"Loading eero session key from '{self.__session_file}'")
+        self.__session_manager = SessionManager.for_file(self.__session_file)
+
+        # with a poller daemon running, presence comes from it and this scanner never calls eero
+        daemon_socket = config.get(CONF_DAEMON_SOCKET)
+        self.__daemon = DaemonSubscriber(hass.config.path(daemon_socket)).start() if daemon_socket else None
+        if self.__daemon is not None:
+            _LOGGER.info(f"Following the eero_tracker daemon at {self.__daemon.socket_path} instead of polling")
+        elif self.__session_manager.token is None:
             _LOGGER.error(f"Could not find the eero.session file '{self.__session_file}'")
-            self.__session = None
+
+        # serve the devices present at the last scan until the first live scan completes
+        self.__snapshot_file = sibling_path(self.__session_file, 'devices.json')
+        self.__snapshot_saved = None
+        self.__warm = self._load_snapshot()
+
+        hass.data.setdefault(EERO_DOMAIN, {}).setdefault(DATA_SCANNERS, []).append(self)
 
     def scan_devices(self):
         """Required for the API, handles returning results"""
         # Return empty array if the session was never started.
-        if self.__session is None:
+        if self.__daemon is None and self._session is None:
             return []
 
-        self._update_info()
-        return self.__last_results
+        if self.__warm:
+            # answer from the snapshot right away; the first live scan runs in the background
+            self.__warm = False
+            self.__hass.add_job(self.scan_devices)
+            return self.__registry.current.macs
+
+        with PROFILER.scan(), METRICS.timer(SCAN_DURATION):
+            if self.__daemon is not None:
+                self._update_from_daemon()
+            else:
+                self._update_info()
+        self._record_scan()
+        return self.__registry.current.macs
 
     def get_device_name(self, mac):
         """Required for the API. None to indicate we don't know the devices true name"""
-        return self.__mac_to_nickname.get(mac)
+        return self.__registry.current.nickname(mac)
 
-    def _update_info(self):
-        """Retrieve the latest information from Eero for returning to HA."""
-        # Cache the accounts for an hour. These rarely change and this reduces the
-        # lookup requests to only 1 every update. This cache is reset on Home Assistant
-        # restarts, so in an emergency a user can always restart Home Assistant to force update.
-        if self.__account_update_timestamp is None or (time.time() - self.__account_update_timestamp) >= CACHE_EXPIRY:
-            _LOGGER.debug(f"Updating eero account information cache (expires every {CACHE_EXPIRY} seconds)")
-            self.__account = self._account()
-            self.__account_update_timestamp = time.time()
-
-        self.__mac_to_nickname = {}
-        self.__last_results = []
-        
-        for network in self.__account['networks']['data']:
-            match = re.search('/networks/(\d+)', network['url'])
-            network_id = int(match.group(1))
-            
-            # if specific networks should be filtered, skip any not in the filter
-            if len(self.__only_networks) > 0 and network_id not in self.__only_networks:
-                _LOGGER.debug(f"Ignoring network {network_id} devices not in only_networks: {self.__only_networks}")
-                continue
+    @property
+    def last_diff(self):
+        """The PresenceDiff (joined, left, renamed) computed by the most recent scan"""
+        return self.__last_diff
+
+    @property
+    def session_file(self):
+        return self.__session_file
 
-            # load all devices for this network, but only track connected wireless devices
-            devices = self._devices(network['url'])
-            json_obj = json.loads(json.dumps(devices, indent=4))
-            self._update_tracked_devices(network_id, json_obj)
+    @property
+    def snapshot(self):
+        """The ScanSnapshot of the devices present as of the last completed scan"""
+        return self.__registry.current
 
-        return
+    @property
+    def history(self):
+        """The PresenceHistory of joins and departures, or None if history_days is 0"""
+        return self.__history
 
-    def _update_tracked_devices(self, network_id, devices_json_obj):
-        for device in devices_json_obj:
-            # skip devices that are not connected
-            if not device['connected']:
-                continue
+    def close_history(self):
+        """Logs every present device as leaving and closes the history; called when Home Assistant stops"""
+        if self.__history is None:
+            return
+        departures = PresenceDiff()
+        departures.left.extend(self.__registry.current.devices.values())
+        self.__history.record(departures)
+        self.__history.close()
+
+    def add_diff_listener(self, listener):
+        """Calls listener(diff) after each scan that changed presence; returns a callable to remove it"""
+        self.__diff_listeners.append(listener)
+        return lambda: self.__diff_listeners.remove(listener)
+
+    async def async_scan_devices(self):
+        """Async variant of scan_devices, fetching every network concurrently"""
+        if self.__daemon is None and self._session is None:
+            return []
+
+        if self.__warm:
+            self.__warm = False
+            self.__hass.async_create_task(self.async_scan_devices())
+            return self.__registry.current.macs
+
+        with PROFILER.scan(on_loop=True), METRICS.timer(SCAN_DURATION):
+            if self.__daemon is not None:
+                # only in-memory work, so it runs right here on the loop
+                self._update_from_daemon()
+            else:
+                await self._async_update_info()
+        self._record_scan()
+        return self.__registry.current.macs
+
+    async def async_get_device_name(self, mac):
+        """Name lookups are in-memory, so there is no need for an executor hop"""
+        return self.get_device_name(mac)
+
+    def _record_scan(self):
+        METRICS.inc(SCANS)
+        # one series per account; the devices_present sensor sums them
+        METRICS.set(DEVICES_LAST_SCAN, len(self.__registry), account=self.__session_file)
+
+        now = time.time()
+        if self.__last_diff or self.__snapshot_saved is None or now - self.__snapshot_saved >= SNAPSHOT_INTERVAL:
+            self.__snapshot_saved = now
+            self.__hass.add_job(self._save_snapshot, self.__registry.current, now)
+
+    def _load_snapshot(self):
+        data = read_json(self.__snapshot_file)
+        if not data or not isinstance(data.get('devices'), list):
+            return False
+        age = time.time() - data.get('timestamp', 0)
+        if age > WARM_START_MAX_AGE:
+            _LOGGER.debug(f"Ignoring eero device snapshot from {age:.0f} seconds ago")
+            return False
+
+        snapshot = self.__registry.restore(data['devices'])
+        if self.__history is not None:
+            # they are present from now on; the history logged them leaving at shutdown
+            restored = PresenceDiff()
+            restored.joined.extend(snapshot.devices.values())
+            self.__history.record(restored)
+        _LOGGER.info(f"Serving {len(self.__registry)} devices from the snapshot taken {age:.0f} seconds ago "
+                     f"until the first scan completes")
+        return True
+
+    def _save_snapshot(self, snapshot, timestamp):
+        """Writes a ScanSnapshot to disk; immutable, so this may run in the executor while scans go on"""
+        try:
+            write_json(self.__snapshot_file, dict(timestamp=timestamp, devices=snapshot.entries()))
+        except (IOError, OSError):
+            _LOGGER.error(f"Could not write eero device snapshot {self.__snapshot_file}")
+
+    def shutdown(self):
+        """Saves the device snapshot and closes the history; called when Home Assistant stops"""
+        if self.__daemon is not None:
+            self.__daemon.stop()
+        self._save_snapshot(self.__registry.current, time.time())
+        self.close_history()
+
+    def reset_schedule(self):
+        """Makes every network due on the next scan, regardless of its adaptive interval"""
+        self.__account.scheduler.reset()
+
+    def invalidate_account_cache(self):
+        """Expires the cached network list and revalidates it in the background"""
+        _LOGGER.info("Invalidating eero account information cache")
+        self.__account.account_cache.invalidate()
+        shared_cache().invalidate('account')
+        if self._session is not None:
+            self.__account.revalidate_networks(shared_pool())
+
+    async def async_force_refresh(self):
+        """Refetches the account and every network now, bypassing all caches.
+
+        Runs on the event loop like the tracker's own scans, so the two never touch the registry at once.
+        """
+        _LOGGER.info("Forcing a full eero refresh")
+        shared_cache().clear()
+        self.reset_schedule()
+        self.__warm = False
+        if self.__daemon is None and self._session is not None:
+            account = await self._async_refreshed('account')
+            # on failure the scan falls back to the cached network list
+            if account is not None:
+                await self.__hass.async_add_executor_job(self.__account.account_cache.update, account)
+        return await self.async_scan_devices()
+
+    def diagnostics(self):
+        """Sizes of the scanner's in-memory state, for memory_snapshot reports"""
+        return {
+            'session file': self.__session_file,
+            'devices present': len(self.__registry.current),
+            'networks polled': len(self.__registry.current.networks),
+            'cached networks': len(self.__account.account_cache.networks or ()),
+            'diff listeners': len(self.__diff_listeners),
+        }
+
+    def _publish_diff(self, diff, scanned_network_ids):
+        """Drops networks that are no longer scanned and notifies diff listeners"""
+        diff.extend(self.__account.retain(scanned_network_ids))
+
+        # every network of this scan is applied; readers switch over to it in one swap
+        self.__registry.publish()
+        self.__last_diff = diff
+        if diff:
+            _LOGGER.debug(f"Eero presence changed: {diff}")
+            if self.__history is not None and self.__history.record(diff):
+                # the write happens in the executor, as this may be running on the event loop
+                self.__hass.add_job(self.__history.flush)
+            for record in diff.joined:
+                _LOGGER.debug(f"Network {record.network_id} device found: nickname={record.nickname}; host={record.hostname}; mac={record.mac}")
+            for listener in list(self.__diff_listeners):
+                try:
+                    listener(diff)
+                except Exception:
+                    _LOGGER.exception("Error in eero presence diff listener")
+
+    def _update_info(self):
+        """Retrieve the latest information from Eero for returning to HA."""
+        # load all due networks' devices in parallel on the worker pool shared by every
+        # scanner, which keeps each account (session file) within its own request budget
+        pool = shared_pool()
+        try:
+            # only the first run (nothing cached yet) waits for the account
+            networks = self.__account.networks(pool)
+        except ClientException as exception:
+            _LOGGER.error(f"Eero connection failure: {exception.error_message}")
+            return
 
-            # if only wireless devices are tracked, then skip if not wireless
-            if self.__only_wireless and not device['wireless']:
+        diff = PresenceDiff()
+        self.__account.polled = []
+        pending = [(network_id, pool.submit(self.__session_file, self._devices, url))
+                   for network_id, url in networks if self.__account.scheduler.is_due(network_id)]
+
+        for network_id, future in pending:
+            try:
+                devices = future.result()
+            except ClientException:
+                # keep the network's previous devices rather than reporting them all as gone
+                self._network_failed(network_id)
                 continue
+            diff.extend(self.__account.apply(network_id, devices))
+
+        self._publish_diff(diff, [network_id for network_id, _ in networks])
+
+    def _network_failed(self, network_id):
+        delay = self.__account.scheduler.record_failure(network_id)
+        _LOGGER.warning(f"Polling eero network {network_id} failed; backing off for {delay:.0f} seconds")
+
+    async def _async_update_info(self):
+        """Retrieve the latest information from Eero, requesting all networks at the same time."""
+        if self.__account.account_cache.networks is None:
+            # nothing cached yet (first run), so this one scan has to wait for the account
+            account = await self._async_refreshed('account')
+            if account is None:
+                return
+            await self.__hass.async_add_executor_job(self.__account.account_cache.update, account)
+
+        # with the list cached, this never waits on eero; an expired list is refetched on the pool
+        networks = self.__account.networks(shared_pool())
+        self.__account.polled = []
+        due = self.__account.scheduler.due([network_id for network_id, _ in networks])
+        actions = ['networks/{}/devices'.format(network_id) for network_id in due]
+        results = await self._async_refreshed_many(actions)
+
+        # apply the results only once every response is in, so readers never see a half-built scan
+        diff = PresenceDiff()
+        for network_id, devices in zip(due, results):
+            if isinstance(devices, Exception):
+                _LOGGER.error(f"Eero connection failure for network {network_id}: {self._error_message(devices)}")
+                self._network_failed(network_id)
+                continue
+            diff.extend(self.__account.apply(network_id, devices))
+
+        self._publish_diff(diff, [network_id for network_id, _ in networks])
 
-            # if mac addressess are whitelisted with only_macs, skip if not on the list
-            mac = device['mac']
-            if len(self.__only_macs) > 0 and mac not in self.__only_macs:
+    def _update_from_daemon(self):
+        """Applies the polls the daemon made since the last scan, filtered and debounced like our own"""
+        update = self.__daemon.take()
+        if update is None:
+            # not synced with the daemon yet; keep what we have (e.g. the warm start snapshot)
+            return
+        network_ids, devices, polled = update
+
+        network_ids = [network_id for network_id in network_ids if self.__filter.network_allowed(network_id)]
+        diff = PresenceDiff()
+        for network_id in network_ids:
+            if network_id not in polled:
                 continue
+            seen = {}
+            for mac, nickname, hostname, _, wireless, node, band in devices.get(network_id, ()):
+                if self.__filter.accepts(mac, hostname, wireless):
+                    seen[mac] = (nickname, hostname, wireless, node, band)
+            diff.extend(self.__account.apply_seen(network_id, seen))
+
+        self._publish_diff(diff, network_ids)
+
+    def _get_async_client(self):
+        if self.__async_client is None:
+            # requests take turns with every other scanner's account, like the threaded scans on shared_pool()
+            self.__async_client = AsyncClient(async_get_clientsession(self.__hass), MAX_CONCURRENT_REQUESTS,
+                                              api_endpoint=self.API_ENDPOINT, rate_limiter=self.__rate_limiter,
+                                              scheduler=shared_async_scheduler(), account=self.__session_file)
+        return self.__async_client
 
-            # create mapping of mac addresses to nicknames for lookup by device_name (if a nickname is assigned)
-            nickname = device['nickname']
+    @staticmethod
+    def _error_message(exception):
+        return getattr(exception, 'error_message', None) or repr(exception)
 
-            # default nickname to host name if missing
-            if not nickname or nickname == 'None':
-                nickname = device['hostname']
+    @staticmethod
+    def _needs_refresh(exception):
+        return (isinstance(exception, ClientException)
+                and exception.status == 401 and exception.error_message == 'error.session.refresh')
+
+    async def _async_refreshed(self, action):
+        """GET an action on the event loop, refreshing the session once if needed"""
+        result = (await self._async_refreshed_many([action]))[0]
+        if isinstance(result, Exception):
+            _LOGGER.error(f"Eero connection failure: {self._error_message(result)}")
+            return None
+        return result
 
-            if nickname:
-                self.__mac_to_nickname[mac] = nickname
+    @staticmethod
+    def _parser_for(actions):
+        """Device lists only need the projected fields; anything else is decoded in full"""
+        if all(action.endswith('/devices') for action in actions):
+            return parse_devices
+        return None
+
+    async def _async_refreshed_many(self, actions):
+        """GET several actions concurrently; a single session refresh covers every failed request"""
+        client = self._get_async_client()
+        cookies = self._cookie_dict
+        results = await client.get_many(actions, parser=self._parser_for(actions), cookies=cookies)
+
+        retry = [index for index, result in enumerate(results)
+                 if isinstance(result, ClientException) and result.status == 401]
+        if retry:
+            # one refresh, if any request was told to refresh, covers every unauthorized request
+            exception = next((results[index] for index in retry if self._needs_refresh(results[index])),
+                             results[retry[0]])
+        if retry and await self.__hass.async_add_executor_job(self._retry_after, exception, cookies['s']):
+            retried = await client.get_many([actions[index] for index in retry], parser=self._parser_for(actions),
+                                            cookies=self._cookie_dict)
+            for index, result in zip(retry, retried):
+                results[index] = result
+
+        return results
 
-            _LOGGER.debug(f"Network {network_id} device found: nickname={nickname}; host={device['hostname']}; mac={mac}")
-            self.__last_results.append(mac)
+    @property
+    def _session(self):
+        return self.__session_manager.token
 
     @property
     def _cookie_dict(self):
         """Creates a session cookie"""
-        return dict(s=self.__session)
+        return dict(s=self._session)
 
     def _refreshed(self, func):
-        """Handles if we need to refresh the logged in session or not"""
+        """Handles if we need to refresh the logged in session or not; func is called with the cookies to send"""
+        cookies = self._cookie_dict
         try:
-            return func()
+            return func(cookies)
         except EeroException as exception:
-            if exception.status == 401 and exception.error_message == 'error.session.refresh':
-                self._login_refresh()
-                return func()
-            else:
-                _LOGGER.error(f"Eero connection failure: {exception.error_message}")
-
-    def _login_refresh(self):
-        """Refresh the Eero session"""
-        response = self._post_req('login/refresh', cookies=self._cookie_dict)
+            if self._retry_after(exception, cookies['s']):
+                return func(self._cookie_dict)
+            _LOGGER.error(f"Eero connection failure: {exception.error_message}")
+            raise
+
+    def _retry_after(self, exception, sent_session):
+        """Whether a request that failed with exception should be retried with a newer session"""
+        if exception.status != 401:
+            return False
+        if exception.error_message == 'error.session.refresh':
+            return self._login_refresh(sent_session)
+        # sent just before a peer refreshed the session, so eero no longer knows it
+        return self.__session_manager.settled_token() != sent_session
+
+    def _login_refresh(self, stale_session):
+        """Refresh the Eero session a request was sent with; returns whether there is a newer one to retry with.
+
+        Concurrent refreshes (in any process) are coalesced into one, and a session
+        a peer has already replaced is not refreshed again.
+        """
+        try:
+            with METRICS.timer(SESSION_REFRESH_DURATION):
+                new_session = self.__session_manager.refresh(stale_session, self._refresh_session_key)
+        except ClientException as exception:
+            _LOGGER.error(f"Failed updating eero session key! {exception.error_message}")
+            return False
+        return new_session != stale_session
+
+    def _refresh_session_key(self, stale_session):
+        # only counted when this process actually asks eero for a new key
+        METRICS.inc(SESSION_REFRESHES)
+        response = self._post_req('login/refresh', cookies=dict(s=stale_session))
         new_session = response.get('user_token')
         if not new_session:
             _LOGGER.error(f"Failed updating eero session key! {response}")
-            return
-
-        _LOGGER.debug(f"Updating {self.__session_file} with new session key")
-        try:
-            # update in-memory session first, in case there is any failure in writing to the
-            # session file, at least this tracker will continue working until next HA restart
-            self.__session = new_session
-
-            # TODO: ideally write to a temp file, and if successful, then move to overwrite
-            # the existing session file
-            with open(self.__session_file, 'w+') as f:
-                f.write(new_session)
-        except IOError:
-            _LOGGER.error(f"Could not update eero session key in {self.__session_file}")
-
-    def _account(self):
-        return self._refreshed(lambda: self._get_req('account', cookies=self._cookie_dict))
+        return new_session
 
     @staticmethod
     def _id_from_url(id_or_url):
@@ -218,24 +658,13 @@ class EeroDeviceScanner(DeviceScanner):
 
     def _devices(self, network_id):
         """Gets the list of devices from Eero"""
-        return self._refreshed(lambda: self._get_req('networks/{}/devices'.format(self._id_from_url(network_id)),
-                                                     cookies=self._cookie_dict))
-
-    @staticmethod
-    def _parse_response(response):
-        """Basic response handler"""
-        data = json.loads(response.text)
-        response_code = data['meta']['code']
-        if response_code not in [ 200, 201 ]:
-            raise EeroException(response_code, data['meta'].get('error', ""))
-        return data.get('data', "")
+        return self._refreshed(lambda cookies: self._get_req(
+            'networks/{}/devices'.format(self._id_from_url(network_id)), parser=parse_devices, cookies=cookies))
 
     def _post_req(self, action, **kwargs):
-        """POST a request"""
-        response = requests.post(self.API_ENDPOINT.format(action), **kwargs)
-        return self._parse_response(response)
+        """POST a request over the shared connection pool"""
+        return self.__client.post(action, **kwargs)
 
     def _get_req(self, action, **kwargs):
-        """GET a request"""
-        response = requests.get(self.API_ENDPOINT.format(action), **kwargs)
-        return self._parse_response(response)
+        """GET a request over the shared connection pool"""
+        return self.__client.get(action, **kwargs)
@@ -1,15 +1,48 @@
 import re
-import json
-import requests
-from argparse import ArgumentParser
+import asyncio
+from functools import partial
 from abc import abstractproperty
+from contextlib import nullcontext
+
+from requests.cookies import RequestsCookieJar
+
+try:
+    import aiohttp
+except ImportError:  # only the async client needs aiohttp; Home Assistant always ships it
+    aiohttp = None
+
+from .breaker import breaker_for
+from .cache import shared_cache
+from .metrics import (
+    METRICS,
+    PARSE_DURATION,
+    REQUEST_DURATION,
+    REQUEST_ERRORS,
+    REQUESTS,
+    RESPONSE_BYTES,
+    SESSION_REFRESHES,
+    endpoint_label,
+)
+from .parser import parse_devices
+from .ratelimit import MAX_WAIT, priority_for
+from .session import SessionManager
+from .transport import (
+    API_ENDPOINT,
+    CONNECT_TIMEOUT,
+    READ_TIMEOUT,
+    ClientException,
+    Transport,
+    parse_body,
+    parse_http_body,
+    shared_transport,
+)
 
 
 class Eero(object):
-    def __init__(self, arg_session):
-        # type(SessionStorage) -> ()
+    def __init__(self, arg_session, client=None):
+        # type(SessionStorage, Client) -> ()
         self.session = arg_session
-        self.client = Client()
+        self.client = client if client is not None else Client()
 
     @property
     def _cookie_dict(self):
@@ -35,23 +68,37 @@ class Eero(object):
         return response
 
     def refreshed(self, func):
+        # func(cookies); the cookie it was sent is the one to refresh, a peer may have replaced it already
+        cookies = self._cookie_dict
         try:
-            return func()
+            return func(cookies)
         except ClientException as exception:
-            if exception.status == 401 and exception.error_message == 'error.session.refresh':
-                self.login_refresh()
-                return func()
-            else:
+            if exception.status != 401:
+                raise
+            if exception.error_message == 'error.session.refresh':
+                self.login_refresh(cookies.get('s'))
+            elif self.session.settled_cookie() == cookies.get('s'):
                 raise
+            # otherwise it was sent just before a peer refreshed the session, and eero no longer knows it
+            return func(self._cookie_dict)
 
-    def login_refresh(self):
-        response = self.client.post('login/refresh', cookies=self._cookie_dict)
-        self.session.cookie = response['user_token']
+    def login_refresh(self, stale_cookie=None):
+        # type(string) -> string
+        # refreshes only if the session still holds stale_cookie (by default, the current cookie)
+        def refresh(stale_cookie):
+            # only counted when this process actually asks eero for a new key
+            METRICS.inc(SESSION_REFRESHES)
+            response = self.client.post('login/refresh', cookies=dict(s=stale_cookie))
+            return response['user_token']
+
+        if stale_cookie is None:
+            stale_cookie = self.session.cookie
+        return self.session.refresh(stale_cookie, refresh)
 
     def account(self):
-        return self.refreshed(lambda: self.client.get(
+        return self.refreshed(lambda cookies: self.client.get(
             'account',
-            cookies=self._cookie_dict))
+            cookies=cookies))
 
     @staticmethod
     def id_from_url(id_or_url):
@@ -62,10 +109,37 @@ class Eero(object):
         if match:
             return match.group(1)
 
-    def devices(self, network_id):
-        return self.refreshed(lambda: self.client.get(
+    def devices(self, network_id, fields=None):
+        # type(string, tuple) -> list
+        # fields projects each device down to just those keys while parsing
+        parser = None if fields is None else partial(parse_devices, fields=fields)
+        return self.refreshed(lambda cookies: self.client.get(
             'networks/{}/devices'.format(
-                self.id_from_url(network_id)), cookies=self._cookie_dict))
+                self.id_from_url(network_id)), parser=parser, cookies=cookies))
+
+
+def _count_error(endpoint, exception):
+    METRICS.inc(REQUEST_ERRORS, endpoint=endpoint, status=str(exception.status or 'connection'))
+
+
+def _parse_instrumented(endpoint, status, body, parser):
+    METRICS.inc(RESPONSE_BYTES, len(body), endpoint=endpoint)
+    try:
+        with METRICS.timer(PARSE_DURATION, endpoint=endpoint):
+            return parse_http_body(status, body, parser)
+    except ClientException as exception:
+        _count_error(endpoint, exception)
+        raise
+
+
+def _parse_with_breaker(breaker, endpoint, status, body, parser):
+    try:
+        result = _parse_instrumented(endpoint, status, body, parser)
+    except ClientException as exception:
+        breaker.record_failure(exception)
+        raise
+    breaker.record_success()
+    return result
 
 
 class SessionStorage(object):
@@ -73,51 +147,173 @@ class SessionStorage(object):
     def cookie(self):
         pass
 
+    def settled_cookie(self):
+        # type() -> string
+        # storages shared between callers wait here for a refresh in progress
+        return self.cookie
 
-class ClientException(Exception):
-    def __init__(self, status, error_message):
-        super(ClientException, self).__init__()
-        self.status = status
-        self.error_message = error_message
+    def refresh(self, stale_cookie, refresh_func):
+        # type(string, callable) -> string
+        # storages shared between callers override this to coalesce concurrent refreshes
+        if self.cookie != stale_cookie:
+            return self.cookie
+        self.cookie = refresh_func(stale_cookie)
+        return self.cookie
 
 
 class Client(object):
-    API_ENDPOINT = 'https://api-user.e2ro.com/2.2/{}'
+    API_ENDPOINT = API_ENDPOINT
 
-    @staticmethod
-    def _parse_response(response):
-        data = json.loads(response.text)
-        if data['meta']['code'] != 200 and data['meta']['code'] != 201:
-            raise ClientException(data['meta']['code'],
-                                  data['meta'].get('error', ""))
-        return data.get('data', "")
+    def __init__(self, transport=None, api_endpoint=None, cache=True, rate_limiter=None):
+        # type(Transport, string, ResponseCache, RateLimiter) -> ()
+        # GETs go through the process-wide response cache unless cache is None/False
+        self.cache = shared_cache() if cache is True else (cache or None)
+        # every request actually sent takes a token from the account's budget, if one is set
+        self.rate_limiter = rate_limiter
+        if transport is None:
+            if api_endpoint is None or api_endpoint == API_ENDPOINT:
+                transport = shared_transport()
+            else:
+                transport = Transport(api_endpoint)
+        self.transport = transport
+        # open after repeated outages, so requests fail fast instead of each waiting out a timeout
+        self.breaker = breaker_for(transport.api_endpoint)
+        # kept for the life of the client, so the session cookie is not rebuilt per request
+        self.cookies = RequestsCookieJar()
+
+    def _request(self, method, action, parser=None, **kwargs):
+        # parser, if given, is handed the raw response bytes instead of the full decode
+        cookies = kwargs.pop('cookies', None)
+        if cookies:
+            self.cookies.update(cookies)
+
+        endpoint = endpoint_label(action)
+        self.breaker.before_request()
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(priority_for(method, action))
+        METRICS.inc(REQUESTS, endpoint=endpoint)
+        try:
+            with METRICS.timer(REQUEST_DURATION, endpoint=endpoint):
+                response = self.transport.request(method, action, cookies=self.cookies, **kwargs)
+                body = response.content
+        except ClientException as exception:
+            _count_error(endpoint, exception)
+            self.breaker.record_failure(exception)
+            raise
+        return _parse_with_breaker(self.breaker, endpoint, response.status_code, body, parser or parse_body)
 
     def post(self, action, **kwargs):
-        response = requests.post(self.API_ENDPOINT.format(action), **kwargs)
-        return self._parse_response(response)
+        return self._request('POST', action, **kwargs)
+
+    def _session(self, cookies):
+        if cookies:
+            return cookies.get('s')
+        return self.cookies.get('s')
+
+    def get(self, action, parser=None, **kwargs):
+        if self.cache is None:
+            return self._request('GET', action, parser=parser, **kwargs)
+        key = self.cache.key(self.transport.api_endpoint, action, self._session(kwargs.get('cookies')), parser)
+        return self.cache.get_or_fetch(key, lambda: self._request('GET', action, parser=parser, **kwargs))
+
+
+class AsyncClient(object):
+    """asyncio counterpart of Client, sharing a caller-owned aiohttp session.
+
+    Requests are bounded by a semaphore so a large account can fan out over
+    all of its networks at once without flooding eero's servers. Given a
+    scheduler (see poller.AsyncFairScheduler), each request also waits for one
+    of account's slots, so clients of different accounts take turns.
+    """
+    API_ENDPOINT = API_ENDPOINT
+    MAX_CONCURRENT_REQUESTS = 4
+
+    def __init__(self, session, max_concurrent_requests=MAX_CONCURRENT_REQUESTS, api_endpoint=None, cache=True,
+                 rate_limiter=None, scheduler=None, account=None):
+        # type(aiohttp.ClientSession, int, string, ResponseCache, RateLimiter, AsyncFairScheduler, string) -> ()
+        if aiohttp is None:
+            raise RuntimeError('aiohttp is required for AsyncClient')
+        self.session = session
+        # shares cached responses and in-flight requests with every other client in the process
+        self.cache = shared_cache() if cache is True else (cache or None)
+        self.rate_limiter = rate_limiter
+        self.scheduler = scheduler
+        self.account = account
+        if api_endpoint is not None:
+            self.API_ENDPOINT = api_endpoint
+        # shared with the threaded clients of the same endpoint
+        self.breaker = breaker_for(self.API_ENDPOINT)
+        self._timeout = aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+        self._semaphore = asyncio.Semaphore(max_concurrent_requests)
+
+    async def _acquire(self, method, action):
+        # the budget's state file is blocking I/O, so checks run in the executor and waits on the loop
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + MAX_WAIT
+        while True:
+            wait = await loop.run_in_executor(None, self.rate_limiter.try_acquire, priority_for(method, action))
+            if not wait:
+                return
+            if loop.time() + wait > deadline:
+                raise ClientException(429, 'error.rate_limited.budget')
+            await asyncio.sleep(wait)
 
-    def get(self, action, **kwargs):
-        response = requests.get(self.API_ENDPOINT.format(action), **kwargs)
-        return self._parse_response(response)
+    async def _request(self, method, action, parser=None, **kwargs):
+        endpoint = endpoint_label(action)
+        self.breaker.before_request()
+        if self.rate_limiter is not None and not self.rate_limiter.unlimited:
+            await self._acquire(method, action)
+        kwargs.setdefault('timeout', self._timeout)
+        slot = self.scheduler.slot(self.account) if self.scheduler is not None else nullcontext()
+        async with self._semaphore, slot:
+            METRICS.inc(REQUESTS, endpoint=endpoint)
+            try:
+                with METRICS.timer(REQUEST_DURATION, endpoint=endpoint):
+                    async with self.session.request(method, self.API_ENDPOINT.format(action), **kwargs) as response:
+                        status = response.status
+                        body = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                exception = ClientException(None, f"error.connection: {error!r}")
+                _count_error(endpoint, exception)
+                self.breaker.record_failure(exception)
+                raise exception from error
+        return _parse_with_breaker(self.breaker, endpoint, status, body, parser or parse_body)
+
+    async def post(self, action, **kwargs):
+        return await self._request('POST', action, **kwargs)
+
+    async def get(self, action, parser=None, **kwargs):
+        if self.cache is None:
+            return await self._request('GET', action, parser=parser, **kwargs)
+        cookies = kwargs.get('cookies')
+        key = self.cache.key(self.API_ENDPOINT, action, cookies.get('s') if cookies else None, parser)
+        return await self.cache.get_or_fetch_async(key, partial(self._request, 'GET', action, parser=parser, **kwargs))
+
+    async def get_many(self, actions, **kwargs):
+        """GET several actions concurrently, returning results in the same order.
+
+        Failures are returned in place of the result (as the raised exception)
+        so one bad network does not discard the others.
+        """
+        return await asyncio.gather(*[self.get(action, **kwargs) for action in actions],
+                                    return_exceptions=True)
 
 
 class CookieStore(SessionStorage):
     def __init__(self, cookie_file):
-        from os import path
-        self.cookie_file = path.abspath(cookie_file)
-
-        try:
-            with open(self.cookie_file, 'r') as f:
-                self.__cookie = f.read()
-        except IOError:
-            self.__cookie = None
+        self.manager = SessionManager.for_file(cookie_file)
+        self.cookie_file = self.manager.session_file
 
     @property
     def cookie(self):
-        return self.__cookie
+        return self.manager.token
 
     @cookie.setter
     def cookie(self, cookie):
-        self.__cookie = cookie
-        with open(self.cookie_file, 'w+') as f:
-            f.write(self.__cookie)
+        self.manager.store(cookie)
+
+    def settled_cookie(self):
+        return self.manager.settled_token()
+
+    def refresh(self, stale_cookie, refresh_func):
+        return self.manager.refresh(stale_cookie, refresh_func)
@@ -0,0 +1,192 @@
+"""
+Compiled device filters.
+
+The configured filters are compiled once into a single predicate: MACs are
+normalized to 48-bit integers (so formatting and case never matter), MAC
+prefixes such as vendor OUIs are looked up through an index grouped by prefix
+length, and hostname globs are joined into one regular expression. A device
+list is then filtered in one batched pass.
+"""
+import re
+from fnmatch import translate
+
+_NON_HEX = re.compile('[^0-9a-fA-F]')
+
+MAC_BITS = 48
+
+
+def mac_to_int(mac):
+    """'AA:bb:CC:dd:ee:ff', 'aabb.ccdd.eeff', ... -> 48-bit integer, or None if it is not a MAC"""
+    if not mac:
+        return None
+    if len(mac) == 17:
+        try:
+            return int(mac.replace(':', '').replace('-', ''), 16)
+        except ValueError:
+            pass
+    digits = _NON_HEX.sub('', mac)
+    if len(digits) != 12:
+        return None
+    return int(digits, 16)
+
+
+def format_mac(value):
+    """48-bit integer -> 'aa:bb:cc:dd:ee:ff'"""
+    digits = f"{value:012x}"
+    return ':'.join(digits[index:index + 2] for index in range(0, 12, 2))
+
+
+def canonical_mac(raw):
+    """The registry form of a reported MAC ('aa:bb:cc:dd:ee:ff'), or None if it is not a MAC"""
+    if raw and len(raw) == 17 and raw[2] == ':':
+        return raw.lower()
+    value = mac_to_int(raw)
+    return format_mac(value) if value is not None else None
+
+
+def parse_mac_prefix(prefix):
+    """'AA:BB:CC' -> (0xaabbcc, 24); each hex digit is four bits of prefix"""
+    digits = re.sub('[:.-]', '', prefix.strip())
+    if not digits or len(digits) > 12 or _NON_HEX.search(digits):
+        raise ValueError(f"Invalid MAC prefix: {prefix}")
+    return int(digits, 16), len(digits) * 4
+
+
+def split_list(value):
+    """Accepts a comma separated string or a list, returning the non-empty stripped entries"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [entry.strip() for entry in value if entry and entry.strip()]
+
+
+class PrefixIndex(object):
+    """MAC prefixes grouped by length, so a lookup is one set probe per distinct length"""
+
+    def __init__(self, prefixes=()):
+        self._by_shift = {}
+        for prefix in prefixes:
+            value, bits = parse_mac_prefix(prefix)
+            self._by_shift.setdefault(MAC_BITS - bits, set()).add(value)
+        self._shifts = tuple(sorted(self._by_shift.items()))
+
+    def __bool__(self):
+        return bool(self._shifts)
+
+    def matches(self, mac_int):
+        for shift, values in self._shifts:
+            if (mac_int >> shift) in values:
+                return True
+        return False
+
+
+def _glob_pattern(globs):
+    if not globs:
+        return None
+    return re.compile('|'.join(f"(?:{translate(glob)})" for glob in globs), re.IGNORECASE)
+
+
+class DeviceFilter(object):
+    """Decides which devices are tracked; compiled once from the configuration"""
+
+    def __init__(self, only_macs=(), exclude_macs=(), only_mac_prefixes=(), exclude_mac_prefixes=(),
+                 only_hostnames=(), exclude_hostnames=(), only_networks=(), only_wireless=True):
+        self.only_macs = frozenset(self._macs(only_macs))
+        self.exclude_macs = frozenset(self._macs(exclude_macs))
+        self.only_prefixes = PrefixIndex(only_mac_prefixes)
+        self.exclude_prefixes = PrefixIndex(exclude_mac_prefixes)
+        self.only_hostnames = _glob_pattern(list(only_hostnames))
+        self.exclude_hostnames = _glob_pattern(list(exclude_hostnames))
+        self.only_networks = frozenset(only_networks)
+        self.only_wireless = only_wireless
+        self._accept = self._compile()
+
+    @staticmethod
+    def _macs(macs):
+        values = []
+        for mac in macs:
+            value = mac_to_int(mac)
+            if value is None:
+                raise ValueError(f"Invalid MAC address: {mac}")
+            values.append(value)
+        return values
+
+    @property
+    def has_includes(self):
+        return bool(self.only_macs or self.only_prefixes or self.only_hostnames)
+
+    def network_allowed(self, network_id):
+        return not self.only_networks or network_id in self.only_networks
+
+    def _compile(self):
+        """Builds one predicate(mac_int, hostname) from only the configured checks"""
+        checks = []
+        only_macs, exclude_macs = self.only_macs, self.exclude_macs
+        only_prefixes, exclude_prefixes = self.only_prefixes, self.exclude_prefixes
+        only_hostnames, exclude_hostnames = self.only_hostnames, self.exclude_hostnames
+
+        if exclude_macs:
+            checks.append(lambda mac, hostname: mac not in exclude_macs)
+        if exclude_prefixes:
+            checks.append(lambda mac, hostname: not exclude_prefixes.matches(mac))
+        if exclude_hostnames:
+            checks.append(lambda mac, hostname: not exclude_hostnames.match(hostname or ''))
+
+        if self.has_includes:
+            # a device is included if any of the include lists match it
+            includes = []
+            if only_macs:
+                includes.append(lambda mac, hostname: mac in only_macs)
+            if only_prefixes:
+                includes.append(lambda mac, hostname: only_prefixes.matches(mac))
+            if only_hostnames:
+                includes.append(lambda mac, hostname: only_hostnames.match(hostname or '') is not None)
+            checks.append(lambda mac, hostname: any(include(mac, hostname) for include in includes))
+
+        if not checks:
+            return None
+        if len(checks) == 1:
+            return checks[0]
+        return lambda mac, hostname: all(check(mac, hostname) for check in checks)
+
+    def accepts(self, mac, hostname, wireless):
+        """Whether a connected device, already reduced to these fields (e.g. by the daemon), passes the filters"""
+        if self.only_wireless and not wireless:
+            return False
+        return self._accept is None or self._accept(mac_to_int(mac), hostname)
+
+    def filter_devices(self, devices):
+        """Returns (normalized mac, device) for every connected device passing the filters"""
+        accept = self._accept
+        only_wireless = self.only_wireless
+        accepted = []
+        for device in devices:
+            # skip devices that are not connected, and wired ones if only wireless devices are tracked
+            if not device['connected'] or (only_wireless and not device['wireless']):
+                continue
+            raw = device['mac']
+            mac = mac_to_int(raw)
+            if mac is None:
+                continue
+            if accept is None or accept(mac, device.get('hostname')):
+                # eero already reports colon separated MACs, so avoid reformatting those
+                canonical = raw.lower() if len(raw) == 17 and raw[2] == ':' else format_mac(mac)
+                accepted.append((canonical, device))
+        return accepted
+
+    def describe(self):
+        parts = []
+        if self.only_macs:
+            parts.append(f"only {len(self.only_macs)} MACs")
+        if self.exclude_macs:
+            parts.append(f"excluding {len(self.exclude_macs)} MACs")
+        if self.only_prefixes:
+            parts.append("only matching MAC prefixes")
+        if self.exclude_prefixes:
+            parts.append("excluding MAC prefixes")
+        if self.only_hostnames:
+            parts.append(f"only hostnames matching {self.only_hostnames.pattern}")
+        if self.exclude_hostnames:
+            parts.append(f"excluding hostnames matching {self.exclude_hostnames.pattern}")
+        return '; '.join(parts) or 'no device filters'
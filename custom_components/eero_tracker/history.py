@@ -0,0 +1,176 @@
+"""
+Append-only log of presence transitions (joins and departures).
+
+Transitions from each scan's PresenceDiff are appended to a bounded in-memory
+ring buffer and a pending batch; the batch is written to a small SQLite
+database next to the session file in one transaction, off the event loop.
+Rows are (mac as a 48-bit integer, unix time, event, network) in a
+WITHOUT ROWID table keyed by (mac, time), with a secondary index on time, so
+"when was this MAC last seen" and "which devices were online in this window"
+are index lookups rather than scans of Home Assistant's recorder.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from .filters import format_mac, mac_to_int
+
+_LOGGER = logging.getLogger(__name__)
+
+JOINED = 1
+LEFT = 0
+
+RING_SIZE = 1024               # most recent transitions answered from memory
+DEFAULT_RETENTION_DAYS = 30
+PRUNE_INTERVAL = 24 * 3600     # seconds between deletes of expired rows
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS transitions ('
+    ' mac INTEGER NOT NULL, ts INTEGER NOT NULL, event INTEGER NOT NULL, network_id INTEGER,'
+    ' PRIMARY KEY (mac, ts, event)) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS transitions_ts ON transitions (ts)',
+)
+
+
+class Transition(object):
+    __slots__ = ('mac', 'timestamp', 'event', 'network_id')
+
+    def __init__(self, mac, timestamp, event, network_id):
+        self.mac = mac
+        self.timestamp = timestamp
+        self.event = event
+        self.network_id = network_id
+
+    def as_dict(self):
+        return dict(mac=format_mac(self.mac), timestamp=self.timestamp,
+                    event='joined' if self.event == JOINED else 'left', network_id=self.network_id)
+
+
+class PresenceHistory(object):
+
+    def __init__(self, db_file, retention_days=DEFAULT_RETENTION_DAYS, ring_size=RING_SIZE, clock=time.time):
+        self.db_file = db_file
+        self.retention = retention_days * 86400
+        self._clock = clock
+        self._ring = deque(maxlen=ring_size)
+        self._pending = []
+        self._lock = threading.Lock()     # guards the ring buffer and pending batch
+        self._db_lock = threading.Lock()  # serializes use of the connection
+        self._db = None
+        self._last_prune = None
+
+    def _connection(self):
+        # opened lazily on first use, which is always in an executor thread
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            for statement in _SCHEMA:
+                self._db.execute(statement)
+        return self._db
+
+    def record(self, diff, timestamp=None):
+        """Queues a PresenceDiff's joins and departures; cheap enough to call on the event loop"""
+        if not (diff.joined or diff.left):
+            return False
+        timestamp = int(timestamp if timestamp is not None else self._clock())
+        transitions = [Transition(mac_to_int(record.mac), timestamp, JOINED, record.network_id)
+                       for record in diff.joined]
+        transitions += [Transition(mac_to_int(record.mac), timestamp, LEFT, record.network_id)
+                        for record in diff.left]
+        with self._lock:
+            self._ring.extend(transitions)
+            self._pending.extend(transitions)
+        return True
+
+    def flush(self):
+        """Writes the pending transitions in one transaction; runs in an executor thread"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        with self._db_lock:
+            try:
+                db = self._connection()
+                if pending:
+                    with db:
+                        db.execute('BEGIN')
+                        db.executemany('INSERT OR REPLACE INTO transitions (mac, ts, event, network_id) '
+                                       'VALUES (?, ?, ?, ?)',
+                                       [(t.mac, t.timestamp, t.event, t.network_id) for t in pending])
+                self._prune(db)
+            except sqlite3.Error as exception:
+                _LOGGER.error(f"Could not write eero presence history {self.db_file}: {exception}")
+                with self._lock:
+                    # keep them for the next flush rather than losing the transitions
+                    self._pending[:0] = pending
+
+    def _prune(self, db):
+        now = self._clock()
+        if not self.retention or (self._last_prune is not None and now - self._last_prune < PRUNE_INTERVAL):
+            return
+        self._last_prune = now
+        db.execute('DELETE FROM transitions WHERE ts < ?', (int(now - self.retention),))
+
+    def last_transition(self, mac):
+        """The most recent Transition for mac, or None if it was never seen"""
+        mac_int = mac_to_int(mac)
+        if mac_int is None:
+            raise ValueError(f"Invalid MAC address: {mac}")
+
+        # the ring holds the newest transitions, so a hit there is the latest one
+        with self._lock:
+            for transition in reversed(self._ring):
+                if transition.mac == mac_int:
+                    return transition
+
+        self.flush()
+        with self._db_lock:
+            row = self._connection().execute(
+                'SELECT ts, event, network_id FROM transitions WHERE mac = ? ORDER BY ts DESC LIMIT 1',
+                (mac_int,)).fetchone()
+        return Transition(mac_int, *row) if row else None
+
+    def online_between(self, start, end):
+        """MACs (as integers) present at any time between two unix timestamps.
+
+        That is every device with a transition inside the window, plus those
+        whose last transition before it was a join.
+        """
+        self.flush()
+        with self._db_lock:
+            rows = self._connection().execute(
+                'SELECT mac FROM transitions WHERE ts BETWEEN ? AND ? '
+                'UNION '
+                'SELECT mac FROM (SELECT mac, event, MAX(ts) FROM transitions WHERE ts < ? GROUP BY mac) '
+                'WHERE event = ?',
+                (int(start), int(end), int(start), JOINED)).fetchall()
+        return {row[0] for row in rows}
+
+    def transitions(self, mac=None, start=None, end=None, limit=1000):
+        """Transitions (newest first), optionally for one MAC and/or a time window"""
+        clauses, params = [], []
+        if mac is not None:
+            clauses.append('mac = ?')
+            params.append(mac_to_int(mac))
+        if start is not None:
+            clauses.append('ts >= ?')
+            params.append(int(start))
+        if end is not None:
+            clauses.append('ts <= ?')
+            params.append(int(end))
+        where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+
+        self.flush()
+        with self._db_lock:
+            rows = self._connection().execute(
+                f'SELECT mac, ts, event, network_id FROM transitions{where} ORDER BY ts DESC LIMIT ?',
+                params + [limit]).fetchall()
+        return [Transition(*row) for row in rows]
+
+    def close(self):
+        self.flush()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,186 @@
+"""
+In-process metrics for the eero request and scan hot paths.
+
+Counters, gauges and fixed-bucket latency histograms are kept in one
+process-wide registry (METRICS) so the client, the scanner and the Home
+Assistant sensors all see the same numbers. render_prometheus() produces the
+Prometheus text exposition format.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_ID_SEGMENT = re.compile(r'/\d+')
+
+# metric names, shared by the instrumented code and the sensors
+REQUEST_DURATION = 'eero_tracker_request_duration_seconds'
+REQUESTS = 'eero_tracker_requests_total'
+REQUEST_ERRORS = 'eero_tracker_request_errors_total'
+RESPONSE_BYTES = 'eero_tracker_response_bytes_total'
+PARSE_DURATION = 'eero_tracker_parse_duration_seconds'
+SCAN_DURATION = 'eero_tracker_scan_duration_seconds'
+SCANS = 'eero_tracker_scans_total'
+DEVICES_PROCESSED = 'eero_tracker_devices_processed_total'
+DEVICES_LAST_SCAN = 'eero_tracker_devices_last_scan'
+SESSION_REFRESHES = 'eero_tracker_session_refreshes_total'
+SESSION_REFRESH_DURATION = 'eero_tracker_session_refresh_duration_seconds'
+PRESENCE_DEBOUNCED = 'eero_tracker_presence_debounced_total'
+RESPONSE_CACHE = 'eero_tracker_response_cache_total'
+CIRCUIT_STATE = 'eero_tracker_circuit_state'
+CIRCUIT_REJECTED = 'eero_tracker_circuit_rejected_total'
+
+_HELP = {
+    REQUEST_DURATION: 'Time spent waiting on the eero API, per endpoint',
+    REQUESTS: 'Requests sent to the eero API, per endpoint',
+    REQUEST_ERRORS: 'Failed eero API requests, per endpoint and status',
+    RESPONSE_BYTES: 'Response body bytes received from the eero API, per endpoint',
+    PARSE_DURATION: 'Time spent parsing eero API responses, per endpoint',
+    SCAN_DURATION: 'Duration of a complete device scan',
+    SCANS: 'Device scans run',
+    DEVICES_PROCESSED: 'Device entries processed from device lists',
+    DEVICES_LAST_SCAN: 'Devices reported present by the most recent scan, per account (session file)',
+    SESSION_REFRESHES: 'eero session refreshes attempted',
+    SESSION_REFRESH_DURATION: 'Duration of eero session refreshes',
+    RESPONSE_CACHE: 'Response cache lookups, per endpoint and result (hit, miss or coalesced)',
+    PRESENCE_DEBOUNCED: 'Device joins and departures held back by presence hysteresis, per poll',
+    CIRCUIT_STATE: 'eero API circuit breaker state (0 closed, 1 half-open, 2 open)',
+    CIRCUIT_REJECTED: 'Requests failed fast while the eero API circuit was open',
+}
+
+
+def endpoint_label(action):
+    """networks/123/devices -> networks/{id}/devices, so label cardinality stays bounded"""
+    return _ID_SEGMENT.sub('/{id}', '/' + action)[1:]
+
+
+class Histogram(object):
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+
+class Metrics(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, labels) -> float
+        self._gauges = {}      # (name, labels) -> float
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._last = {}        # (name, labels) -> last observed value
+
+    @staticmethod
+    def _key(name, labels):
+        # label values are strings in the exposition anyway; mixed int/str values would break sorting
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+            self._last[key] = value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def total(self, name):
+        """Sum of a counter or gauge across all of its labels"""
+        with self._lock:
+            values = [value for (key, _), value in self._counters.items() if key == name]
+            values += [value for (key, _), value in self._gauges.items() if key == name]
+        return sum(values)
+
+    def last(self, name, **labels):
+        """Most recent value observed by a histogram, or None"""
+        with self._lock:
+            return self._last.get(self._key(name, labels))
+
+    def histogram(self, name, **labels):
+        with self._lock:
+            return self._histograms.get(self._key(name, labels))
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+            self._last.clear()
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escaped = ['{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                   for key, value in pairs]
+        return '{' + ','.join(escaped) + '}'
+
+    def render_prometheus(self):
+        """Renders every metric in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            histograms = [(key, list(h.buckets), list(h.counts), h.sum, h.count) for key, h in histograms]
+
+        lines = []
+        declared = set()
+
+        def declare(name, metric_type):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {metric_type}")
+
+        for (name, labels), value in counters:
+            declare(name, 'counter')
+            lines.append(f"{name}{self._format_labels(labels)} {value}")
+        for (name, labels), value in gauges:
+            declare(name, 'gauge')
+            lines.append(f"{name}{self._format_labels(labels)} {value}")
+        for (name, labels), buckets, counts, total, count in histograms:
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{self._format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{self._format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{self._format_labels(labels)} {total}")
+            lines.append(f"{name}_count{self._format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
@@ -0,0 +1,128 @@
+"""
+Projection-only parsing of eero device lists.
+
+The devices endpoint returns a large document per network while the tracker
+only ever reads a handful of fields per device. parse_devices() walks the raw
+response one device at a time and keeps just the projected fields, so the
+full document tree is never held in memory. When orjson is installed it is
+used instead, since decoding in C beats streaming in Python on CPU time.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .transport import ClientException
+
+# last_active lets presence hysteresis keep devices that were active since the last poll;
+# source (the eero node) and interface/connectivity (the band) feed the aggregate sensors
+DEVICE_FIELDS = ('connected', 'wireless', 'mac', 'nickname', 'hostname', 'last_active',
+                 'source', 'interface', 'connectivity')
+
+_WHITESPACE = ' \t\n\r'
+_decoder = json.JSONDecoder()
+
+
+def device_node(device):
+    """Name of the eero node a device is connected to, or None if the payload does not say"""
+    source = device.get('source')
+    if not source:
+        return None
+    return source.get('location') or source.get('display_name')
+
+
+def device_band(device):
+    """Wi-Fi band of a wireless device ('2.4 GHz', '5 GHz', '6 GHz'), or None if the payload does not say"""
+    if not device.get('wireless'):
+        return None
+    interface = device.get('interface')
+    if interface and interface.get('frequency'):
+        return f"{interface['frequency']} {interface.get('frequency_unit') or 'GHz'}"
+    # older payloads only carry the channel frequency in MHz
+    frequency = (device.get('connectivity') or {}).get('frequency')
+    if not isinstance(frequency, (int, float)) or frequency <= 0:
+        return None
+    if frequency < 3000:
+        return '2.4 GHz'
+    return '5 GHz' if frequency < 5925 else '6 GHz'
+
+
+def _skip_whitespace(text, index):
+    while text[index] in _WHITESPACE:
+        index += 1
+    return index
+
+
+def _project(device, fields):
+    return {field: device.get(field) for field in fields}
+
+
+def _check_meta(meta):
+    if meta is None:
+        raise ClientException(0, 'error.response.meta')
+    if meta['code'] != 200 and meta['code'] != 201:
+        raise ClientException(meta['code'], meta.get('error', ""))
+
+
+def _parse_streaming(text, fields):
+    """Walks {"meta": {...}, "data": [...]} decoding one device object at a time"""
+    meta = None
+    devices = []
+
+    index = _skip_whitespace(text, 0)
+    if text[index] != '{':
+        raise ValueError('Expected a JSON object')
+    index = _skip_whitespace(text, index + 1)
+
+    while text[index] != '}':
+        key, index = _decoder.raw_decode(text, index)
+        index = _skip_whitespace(text, index)
+        if text[index] != ':':
+            raise ValueError(f"Expected ':' at {index}")
+        index = _skip_whitespace(text, index + 1)
+
+        if key == 'data' and text[index] == '[':
+            index = _skip_whitespace(text, index + 1)
+            while text[index] != ']':
+                device, index = _decoder.raw_decode(text, index)
+                devices.append(_project(device, fields))
+                index = _skip_whitespace(text, index)
+                if text[index] == ',':
+                    index = _skip_whitespace(text, index + 1)
+            index += 1
+        else:
+            value, index = _decoder.raw_decode(text, index)
+            if key == 'meta':
+                meta = value
+
+        index = _skip_whitespace(text, index)
+        if text[index] == ',':
+            index = _skip_whitespace(text, index + 1)
+
+    _check_meta(meta)
+    return devices
+
+
+def _parse_orjson(body, fields):
+    data = orjson.loads(body)
+    # fail like the streaming parser does, rather than with an AttributeError
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    _check_meta(data.get('meta'))
+    devices = data.get('data')
+    return [_project(device, fields) for device in devices] if isinstance(devices, list) else []
+
+
+def parse_devices(body, fields=DEVICE_FIELDS, use_orjson=True):
+    """Parses a raw devices response (bytes or str), keeping only the projected fields"""
+    if use_orjson and orjson is not None:
+        return _parse_orjson(body, fields)
+    if isinstance(body, (bytes, bytearray)):
+        body = body.decode('utf-8')
+    try:
+        return _parse_streaming(body, fields)
+    except IndexError:
+        # an empty or truncated body runs off the end; callers expect json's ValueError
+        raise ValueError('Unexpected end of JSON document') from None
@@ -0,0 +1,433 @@
+"""
+Fan-out polling of many eero accounts from one process.
+
+FairWorkerPool runs requests on a bounded set of worker threads. Work is
+queued per account and dispatched round-robin, each account is capped at a
+few requests in flight and a minimum spacing between request starts, so one
+slow or busy account cannot starve the others or exceed its own rate. An
+account out of request budget waits in its queue, never on a worker.
+
+MultiAccountPoller builds on it to poll every network of many accounts
+(each with its own session file) over the one shared connection pool.
+AsyncFairScheduler applies the same limits to requests made on the event
+loop by the async scanners.
+"""
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager, nullcontext
+
+from .account_cache import AccountCache
+from .eero import Client, CookieStore, Eero
+from .filters import DeviceFilter
+from .metrics import DEVICES_PROCESSED, METRICS
+from .parser import DEVICE_FIELDS, device_band, device_node
+from .ratelimit import PRIORITY_ACCOUNT, PRIORITY_PRESENCE, RateLimiter
+from .profiling import PROFILER
+from .presence import PresenceDiff, PresenceHysteresis, PresenceRegistry, inactive_last_active
+from .scheduler import PollScheduler
+from .storage import sibling_path
+from .transport import ClientException, shared_transport
+
+_LOGGER = logging.getLogger(__name__)
+
+MAX_WORKERS = 8
+PER_ACCOUNT_CONCURRENCY = 4
+MIN_REQUEST_SPACING = 0.01 # seconds between request starts for one account
+
+
+class FairWorkerPool(object):
+
+    def __init__(self, max_workers=MAX_WORKERS, per_account_concurrency=PER_ACCOUNT_CONCURRENCY,
+                 min_request_spacing=MIN_REQUEST_SPACING, clock=time.monotonic):
+        self.max_workers = max_workers
+        self.per_account_concurrency = per_account_concurrency
+        self.min_request_spacing = min_request_spacing
+        self._clock = clock
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='eero_poller')
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()  # account -> deque of (future, fn, args); order is the rotation
+        self._in_flight = {}
+        self._last_start = {}
+        self._limiters = {}  # account -> RateLimiter, checked before dispatch
+        self._running = 0
+        self._shutdown = False
+        self._dispatcher = threading.Thread(target=self._dispatch, name='eero_poller_dispatch', daemon=True)
+        self._dispatcher.start()
+
+    def set_limiter(self, account, limiter):
+        """Dispatches account's work only once its RateLimiter has a token for it"""
+        with self._cond:
+            if limiter is None or limiter.unlimited:
+                self._limiters.pop(account, None)
+            else:
+                self._limiters[account] = limiter
+            self._cond.notify()
+
+    def submit(self, account, fn, *args, priority=PRIORITY_PRESENCE):
+        """Queues fn(*args) on behalf of account, returning a concurrent.futures.Future.
+
+        priority is the rate limiter priority of the request fn sends (see ratelimit).
+        """
+        future = Future()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError('FairWorkerPool is shut down')
+            queue = self._queues.get(account)
+            if queue is None:
+                queue = self._queues[account] = deque()
+            queue.append((future, fn, args, priority))
+            self._cond.notify()
+        return future
+
+    def map(self, account, fn, items):
+        """Runs fn(item) for every item and returns the futures in order"""
+        return [self.submit(account, fn, item) for item in items]
+
+    def _next_task(self, now):
+        """Picks the next runnable task round-robin; returns (task, None) or (None, seconds to wait)"""
+        if self._running >= self.max_workers:
+            return None, None
+        wait = None
+        for account, queue in self._queues.items():
+            if not queue or self._in_flight.get(account, 0) >= self.per_account_concurrency:
+                continue
+            ready_at = self._last_start.get(account, float('-inf')) + self.min_request_spacing
+            if ready_at > now:
+                wait = ready_at - now if wait is None else min(wait, ready_at - now)
+                continue
+            limiter = self._limiters.get(account)
+            if limiter is not None:
+                # taken here rather than by the worker, which would sleep until a token is due
+                delay = limiter.try_acquire(queue[0][3])
+                if delay:
+                    wait = delay if wait is None else min(wait, delay)
+                    continue
+            task = queue.popleft()
+            # the account goes to the back of the rotation so the others get a turn first
+            self._queues.move_to_end(account)
+            if not queue:
+                del self._queues[account]
+            return (account, task, limiter), None
+        return None, wait
+
+    def _dispatch(self):
+        with self._cond:
+            while True:
+                if self._shutdown and not self._queues:
+                    return
+                picked, wait = self._next_task(self._clock())
+                if picked is None:
+                    self._cond.wait(wait)
+                    continue
+
+                account, (future, fn, args, _), limiter = picked
+                if not future.set_running_or_notify_cancel():
+                    if limiter is not None:
+                        limiter.refund()
+                    continue
+                self._in_flight[account] = self._in_flight.get(account, 0) + 1
+                self._last_start[account] = self._clock()
+                self._running += 1
+                self._executor.submit(self._run, account, future, fn, args, limiter)
+
+    def _run(self, account, future, fn, args, limiter):
+        try:
+            with PROFILER.task(), (limiter.prepaid() if limiter is not None else nullcontext()):
+                future.set_result(fn(*args))
+        except BaseException as exception:
+            future.set_exception(exception)
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._in_flight[account] -= 1
+                if not self._in_flight[account]:
+                    del self._in_flight[account]
+                self._cond.notify()
+
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify()
+        if wait:
+            self._dispatcher.join()
+        self._executor.shutdown(wait=wait)
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def shared_pool():
+    """Returns the process-wide FairWorkerPool, creating it on first use"""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = FairWorkerPool()
+        return _shared_pool
+
+
+class AsyncFairScheduler(object):
+    """asyncio counterpart of FairWorkerPool for clients making requests on the event loop.
+
+    Rather than running the work itself it hands out request slots: at most
+    max_concurrent in total, per_account_concurrency per account, granted
+    round-robin between the accounts waiting for one and spaced at least
+    min_request_spacing apart per account.
+    """
+
+    def __init__(self, max_concurrent=MAX_WORKERS, per_account_concurrency=PER_ACCOUNT_CONCURRENCY,
+                 min_request_spacing=MIN_REQUEST_SPACING, clock=time.monotonic):
+        self.max_concurrent = max_concurrent
+        self.per_account_concurrency = per_account_concurrency
+        self.min_request_spacing = min_request_spacing
+        self._clock = clock
+        self._queues = OrderedDict()  # account -> deque of waiting futures; order is the rotation
+        self._in_flight = {}
+        self._last_start = {}
+        self._running = 0
+        self._timer = None
+
+    @asynccontextmanager
+    async def slot(self, account):
+        """Holds one of account's request slots for the duration of the block"""
+        await self.acquire(account)
+        try:
+            yield
+        finally:
+            self.release(account)
+
+    async def acquire(self, account):
+        waiter = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(account)
+        if queue is None:
+            queue = self._queues[account] = deque()
+        queue.append(waiter)
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # a cancelled waiter still in its queue is skipped; one granted a slot gives it back
+            if waiter.done() and not waiter.cancelled():
+                self.release(account)
+            raise
+
+    def release(self, account):
+        self._running -= 1
+        self._in_flight[account] -= 1
+        if not self._in_flight[account]:
+            del self._in_flight[account]
+        self._dispatch()
+
+    def _next_waiter(self, now):
+        """Picks the next account round-robin; returns (account, waiter, None) or (None, None, seconds to wait)"""
+        wait = None
+        for account, queue in list(self._queues.items()):
+            while queue and queue[0].cancelled():
+                queue.popleft()
+            if not queue:
+                del self._queues[account]
+                continue
+            if self._in_flight.get(account, 0) >= self.per_account_concurrency:
+                continue
+            ready_at = self._last_start.get(account, float('-inf')) + self.min_request_spacing
+            if ready_at > now:
+                wait = ready_at - now if wait is None else min(wait, ready_at - now)
+                continue
+            waiter = queue.popleft()
+            # the account goes to the back of the rotation so the others get a turn first
+            self._queues.move_to_end(account)
+            if not queue:
+                del self._queues[account]
+            return account, waiter, None
+        return None, None, wait
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._running < self.max_concurrent:
+            account, waiter, wait = self._next_waiter(self._clock())
+            if waiter is None:
+                if wait is not None:
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            self._in_flight[account] = self._in_flight.get(account, 0) + 1
+            self._last_start[account] = self._clock()
+            self._running += 1
+            waiter.set_result(None)
+
+
+_shared_async_scheduler = None
+
+
+def shared_async_scheduler():
+    """Returns the process-wide AsyncFairScheduler; only ever used from the event loop"""
+    global _shared_async_scheduler
+    if _shared_async_scheduler is None:
+        _shared_async_scheduler = AsyncFairScheduler()
+    return _shared_async_scheduler
+
+
+def network_id_from_url(url):
+    return int(re.search(r'/networks/(\d+)', url).group(1))
+
+
+class AccountPoller(object):
+    """One account (session file) managed by MultiAccountPoller"""
+
+    def __init__(self, key, session_file, client, device_filter, min_interval, max_interval, hysteresis=None):
+        self.key = key
+        self.eero = Eero(CookieStore(session_file), client)
+        self.account_cache = AccountCache(sibling_path(session_file, 'account.json'))
+        self.account_cache.load()
+        self.filter = device_filter
+        self.scheduler = PollScheduler(min_interval, max_interval)
+        self.registry = PresenceRegistry()
+        self.hysteresis = hysteresis if hysteresis is not None else PresenceHysteresis()
+        self.network_ids = []  # every network scanned, as of the last poll
+        self.polled = []       # the networks the last poll actually fetched
+
+    def networks(self, pool=None):
+        """(network_id, url) for every network passing the filter.
+
+        Only the very first lookup waits on the account endpoint. Once the list
+        expires it is still served while pool (or without one, this call) refetches it.
+        """
+        if self.account_cache.networks is None:
+            self.account_cache.update(self.eero.account())
+        elif self.account_cache.expired:
+            self.revalidate_networks(pool)
+        return [(network_id_from_url(network['url']), network['url'])
+                for network in self.account_cache.networks
+                if self.filter.network_allowed(network_id_from_url(network['url']))]
+
+    def revalidate_networks(self, pool=None):
+        """Refetches the network list on pool (or without one, now) unless a refetch is already running"""
+        if not self.account_cache.begin_refresh():
+            return
+        if pool is None:
+            self._revalidate_networks()
+        else:
+            pool.submit(self.key, self._revalidate_networks, priority=PRIORITY_ACCOUNT)
+
+    def refresh_networks(self):
+        """Refetches the account's network list now; on failure the cached list stays in use"""
+        try:
+            self.account_cache.update(self.eero.account())
+        except ClientException as exception:
+            _LOGGER.warning(f"Account {self.key}: using cached networks ({exception.error_message})")
+
+    def _revalidate_networks(self):
+        try:
+            self.refresh_networks()
+        finally:
+            self.account_cache.end_refresh()
+
+    def retain(self, network_ids):
+        """Forgets every network not in network_ids, returning the PresenceDiff of its devices leaving"""
+        self.network_ids = list(network_ids)
+        diff = PresenceDiff()
+        for network_id in self.registry.network_ids - set(self.network_ids):
+            diff.extend(self.registry.remove_network(network_id))
+            self.scheduler.forget(network_id)
+            self.hysteresis.forget(network_id)
+        return diff
+
+    def apply(self, network_id, devices):
+        """Applies one network's polled device list and schedules its next poll, returning the PresenceDiff"""
+        METRICS.inc(DEVICES_PROCESSED, len(devices))
+        seen = {}
+        # one pass drops disconnected, wired (if only_wireless) and filtered out devices
+        for mac, device in self.filter.filter_devices(devices):
+            nickname = device.get('nickname')
+            # default nickname to host name if missing
+            if not nickname or nickname == 'None':
+                nickname = device.get('hostname')
+            seen[mac] = (nickname or None, device.get('hostname'), device.get('wireless'),
+                         device_node(device), device_band(device))
+        last_active = (inactive_last_active(self.registry, network_id, devices)
+                       if self.hysteresis.leave_seconds else None)
+        diff = self.apply_seen(network_id, seen, last_active)
+        self.scheduler.record_success(network_id, bool(diff))
+        self.polled.append(network_id)
+        return diff
+
+    def apply_seen(self, network_id, seen, last_active=None):
+        """Debounces one network's seen devices ({mac: fields}) and applies them, returning the PresenceDiff"""
+        if self.hysteresis.enabled:
+            self.hysteresis.apply(self.registry, network_id, seen, last_active)
+        return self.registry.update_network(network_id, seen)
+
+
+class MultiAccountPoller(object):
+    """Polls every network of many eero accounts over one connection pool and worker pool"""
+
+    def __init__(self, pool=None, transport=None, min_interval=25, max_interval=120,
+                 fields=DEVICE_FIELDS):
+        self.pool = pool if pool is not None else shared_pool()
+        self.transport = transport if transport is not None else shared_transport()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.fields = fields
+        self.accounts = OrderedDict()
+
+    def add_account(self, key, session_file, device_filter=None, hysteresis=None,
+                    requests_per_minute=None, burst=None):
+        # the request budget is left to the account's other users unless one is given here
+        if device_filter is None:
+            device_filter = DeviceFilter(only_wireless=False)
+        client = Client(self.transport, rate_limiter=RateLimiter.for_file(session_file, requests_per_minute, burst))
+        self.pool.set_limiter(key, client.rate_limiter)
+        self.accounts[key] = AccountPoller(key, session_file, client, device_filter,
+                                           self.min_interval, self.max_interval, hysteresis)
+        return self.accounts[key]
+
+    def remove_account(self, key):
+        self.accounts.pop(key, None)
+
+    def poll(self, force=False):
+        """Polls every due network of every account; returns {account key: PresenceDiff}.
+
+        Accounts run concurrently on the shared pool. A failing network backs off
+        on its own schedule and keeps its previous devices.
+        """
+        pending = []
+        diffs = OrderedDict((key, PresenceDiff()) for key in self.accounts)
+
+        for account in self.accounts.values():
+            account.polled = []
+        # only an account without a cached network list has to look it up before polling
+        lookups = {account.key: self.pool.submit(account.key, account.networks, self.pool, priority=PRIORITY_ACCOUNT)
+                   for account in self.accounts.values() if account.account_cache.networks is None}
+        for account in self.accounts.values():
+            try:
+                lookup = lookups.get(account.key)
+                networks = lookup.result() if lookup is not None else account.networks(self.pool)
+            except ClientException as exception:
+                _LOGGER.error(f"Account {account.key}: account lookup failed: {exception.error_message}")
+                continue
+            diffs[account.key].extend(account.retain(network_id for network_id, _ in networks))
+
+            for network_id, url in networks:
+                if force or account.scheduler.is_due(network_id):
+                    future = self.pool.submit(account.key, account.eero.devices, url, self.fields)
+                    pending.append((account, network_id, future))
+
+        for account, network_id, future in pending:
+            try:
+                devices = future.result()
+            except ClientException as exception:
+                delay = account.scheduler.record_failure(network_id)
+                _LOGGER.warning(f"Account {account.key}: network {network_id} failed "
+                                f"({exception.error_message}); backing off {delay:.0f}s")
+                continue
+            diffs[account.key].extend(account.apply(network_id, devices))
+
+        for account in self.accounts.values():
+            account.registry.publish()
+        return diffs
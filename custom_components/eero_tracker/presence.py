@@ -0,0 +1,379 @@
+"""
+Persistent, MAC-indexed registry of the devices currently present on each
+eero network.
+
+Each poll is applied as a diff against the registry so only the records that
+actually changed are touched, and the diff itself is handed to anyone that
+wants to react to joins, departures and renames without rescanning. Device
+counts per network, eero node, band and connection type are kept up to date
+from the same changes, so aggregate sensors never iterate over devices.
+Readers never touch the registry itself: once a scan has been applied the
+registry publishes an immutable ScanSnapshot, swapped in with a single
+reference assignment, so lookups from any thread see one complete scan
+without locking or copying.
+PresenceHysteresis sits in front of the registry and debounces joins and
+departures, so a device that misses (or appears in) a single poll does not
+flap.
+"""
+import datetime
+import time
+from collections import Counter, namedtuple
+from types import MappingProxyType
+
+from .filters import canonical_mac
+from .metrics import METRICS, PRESENCE_DEBOUNCED
+
+
+# aggregate count keys, as (kind, ...) tuples
+COUNT_CONNECTION = 'connection'  # ('connection', 'wireless' or 'wired')
+COUNT_NETWORK = 'network'        # ('network', network_id)
+COUNT_NODE = 'node'              # ('node', network_id, node name)
+COUNT_BAND = 'band'              # ('band', '5 GHz')
+
+
+class DeviceRecord(object):
+    """A present device; slotted to keep large registries compact"""
+    __slots__ = ('mac', 'nickname', 'hostname', 'network_id', 'wireless', 'node', 'band')
+
+    def __init__(self, mac, nickname, hostname, network_id, wireless, node=None, band=None):
+        self.mac = mac
+        self.nickname = nickname
+        self.hostname = hostname
+        self.network_id = network_id
+        self.wireless = wireless
+        self.node = node
+        self.band = band
+
+    def state(self):
+        return DeviceState(self.mac, self.nickname, self.hostname, self.network_id, self.wireless, self.node,
+                           self.band)
+
+    def count_keys(self):
+        """The aggregate counts this device is included in"""
+        keys = [(COUNT_CONNECTION, 'wireless' if self.wireless else 'wired'), (COUNT_NETWORK, self.network_id)]
+        if self.node:
+            keys.append((COUNT_NODE, self.network_id, self.node))
+        if self.band:
+            keys.append((COUNT_BAND, self.band))
+        return keys
+
+    def __repr__(self):
+        return f"DeviceRecord(mac={self.mac!r}, nickname={self.nickname!r}, network_id={self.network_id})"
+
+
+DeviceState = namedtuple('DeviceState', ('mac', 'nickname', 'hostname', 'network_id', 'wireless', 'node', 'band'))
+
+
+class ScanSnapshot(object):
+    """The present devices as of one completed scan; immutable, so it can be read from any thread"""
+    __slots__ = ('macs', 'devices', 'networks', 'counts', 'timestamp')
+
+    def __init__(self, devices=(), timestamp=None, counts=None):
+        networks = {}
+        for state in devices:
+            networks.setdefault(state.network_id, []).append(state.mac)
+        self._set({state.mac: state for state in devices},
+                  {network_id: tuple(macs) for network_id, macs in networks.items()}, counts, timestamp)
+
+    @classmethod
+    def from_parts(cls, devices, networks, counts, timestamp):
+        """Builds a snapshot from dicts the caller gives up: mac -> DeviceState and network_id -> macs tuple"""
+        snapshot = object.__new__(cls)
+        snapshot._set(devices, networks, counts, timestamp)
+        return snapshot
+
+    def _set(self, devices, networks, counts, timestamp):
+        set_ = object.__setattr__
+        set_(self, 'devices', MappingProxyType(devices))  # mac -> DeviceState
+        set_(self, 'macs', tuple(devices))
+        set_(self, 'networks', MappingProxyType(networks))
+        set_(self, 'counts', MappingProxyType(dict(counts or {})))  # count key -> devices present
+        set_(self, 'timestamp', timestamp)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ScanSnapshot is immutable')
+
+    def __len__(self):
+        return len(self.macs)
+
+    def __contains__(self, mac):
+        return mac in self.devices
+
+    def __repr__(self):
+        return f"ScanSnapshot(devices={len(self.macs)}, networks={len(self.networks)}, timestamp={self.timestamp})"
+
+    def get(self, mac):
+        return self.devices.get(mac)
+
+    def nickname(self, mac):
+        state = self.devices.get(mac)
+        return state.nickname if state is not None else None
+
+    def count(self, *key):
+        """Devices present under an aggregate count key, e.g. count(COUNT_BAND, '5 GHz')"""
+        return self.counts.get(key, 0)
+
+    def entries(self):
+        """Every device as [mac, nickname, hostname, network_id, wireless, node, band], for persisting"""
+        return [list(state) for state in self.devices.values()]
+
+
+EMPTY_SNAPSHOT = ScanSnapshot()
+
+
+class PresenceDiff(object):
+    """Devices that joined, left or were renamed between two polls"""
+    __slots__ = ('joined', 'left', 'renamed')
+
+    def __init__(self):
+        self.joined = []   # DeviceRecord
+        self.left = []     # DeviceRecord (as it was before leaving)
+        self.renamed = []  # (DeviceRecord, previous nickname)
+
+    def __bool__(self):
+        return bool(self.joined or self.left or self.renamed)
+
+    def __repr__(self):
+        return f"PresenceDiff(joined={len(self.joined)}, left={len(self.left)}, renamed={len(self.renamed)})"
+
+    def extend(self, other):
+        self.joined.extend(other.joined)
+        self.left.extend(other.left)
+        self.renamed.extend(other.renamed)
+
+
+class PresenceRegistry(object):
+    """Present devices keyed by MAC, grouped by the network that reported them.
+
+    Only the scanning thread may use the registry itself; everyone else reads current.
+    """
+
+    def __init__(self, clock=time.time):
+        self._records = {}   # mac -> DeviceRecord
+        self._networks = {}  # network_id -> set of macs
+        # what publish() copies: each record's DeviceState, replaced only when the record changes, and
+        # each network's macs as published, rebuilt only for the networks whose devices came or went
+        self._states = {}
+        self._published_networks = {}
+        self._dirty_networks = set()
+        self._counts = Counter()  # count key -> devices present, kept up to date by every change
+        self._clock = clock
+        self._changed = False
+        self.current = EMPTY_SNAPSHOT  # the last published ScanSnapshot
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, mac):
+        return mac in self._records
+
+    @property
+    def network_ids(self):
+        return set(self._networks)
+
+    def network_macs(self, network_id):
+        """MACs currently present on one network"""
+        return self._networks.get(network_id, ())
+
+    def get(self, mac):
+        return self._records.get(mac)
+
+    def nickname(self, mac):
+        record = self._records.get(mac)
+        return record.nickname if record is not None else None
+
+    def publish(self):
+        """Publishes a new current snapshot if anything changed since the last one; returns current"""
+        if self._changed:
+            self._changed = False
+            for network_id in self._dirty_networks:
+                macs = self._networks.get(network_id)
+                if macs:
+                    self._published_networks[network_id] = tuple(macs)
+                else:
+                    self._published_networks.pop(network_id, None)
+            self._dirty_networks.clear()
+            # built completely before the swap, so readers see the old scan or the new one, never a mix;
+            # unchanged devices and networks are copied over as they are
+            self.current = ScanSnapshot.from_parts(dict(self._states), dict(self._published_networks),
+                                                   self._counts, self._clock())
+        return self.current
+
+    def _add(self, record):
+        self._records[record.mac] = record
+        self._networks.setdefault(record.network_id, set()).add(record.mac)
+        self._states[record.mac] = record.state()
+        self._dirty_networks.add(record.network_id)
+        self._count(record, 1)
+
+    def _remove(self, record):
+        del self._records[record.mac]
+        del self._states[record.mac]
+        self._dirty_networks.add(record.network_id)
+        self._count(record, -1)
+
+    def _count(self, record, delta):
+        for key in record.count_keys():
+            count = self._counts[key] + delta
+            if count:
+                self._counts[key] = count
+            else:
+                del self._counts[key]
+
+    def restore(self, entries):
+        """Loads ScanSnapshot.entries() into an empty registry and publishes it, without reporting any joins"""
+        for entry in entries:
+            # snapshots written before node and band were tracked have five fields
+            self._add(DeviceRecord(*entry))
+        self._changed = True
+        return self.publish()
+
+    def update_network(self, network_id, seen):
+        """Applies one poll of a network.
+
+        seen maps mac -> (nickname, hostname, wireless, node, band) for every
+        device the network currently reports as present. Returns a PresenceDiff.
+        """
+        diff = PresenceDiff()
+        previous = self._networks.get(network_id)
+        if previous is None:
+            previous = self._networks[network_id] = set()
+
+        for mac, (nickname, hostname, wireless, node, band) in seen.items():
+            record = self._records.get(mac)
+            if record is None:
+                record = DeviceRecord(mac, nickname, hostname, network_id, wireless, node, band)
+                self._add(record)
+                diff.joined.append(record)
+                continue
+
+            changed = False
+            if (record.network_id != network_id or record.wireless != wireless
+                    or record.node != node or record.band != band):
+                # roamed between networks, nodes or bands; not a presence change, but the counts move
+                self._count(record, -1)
+                if record.network_id != network_id:
+                    self._networks[record.network_id].discard(mac)
+                    self._dirty_networks.add(record.network_id)
+                    self._dirty_networks.add(network_id)
+                    previous.add(mac)
+                    record.network_id = network_id
+                record.wireless = wireless
+                record.node = node
+                record.band = band
+                self._count(record, 1)
+                changed = True
+
+            if record.nickname != nickname:
+                diff.renamed.append((record, record.nickname))
+                record.nickname = nickname
+                changed = True
+            if record.hostname != hostname:
+                record.hostname = hostname
+                changed = True
+            if changed:
+                self._states[mac] = record.state()
+                self._changed = True
+
+        # every seen mac is now in previous, so anything extra has left
+        if len(previous) > len(seen):
+            for mac in [mac for mac in previous if mac not in seen]:
+                previous.discard(mac)
+                record = self._records[mac]
+                self._remove(record)
+                diff.left.append(record)
+
+        if diff:
+            self._changed = True
+        return diff
+
+    def remove_network(self, network_id):
+        """Drops a network that is no longer scanned; all of its devices leave"""
+        diff = PresenceDiff()
+        for mac in self._networks.pop(network_id, ()):
+            record = self._records[mac]
+            self._remove(record)
+            diff.left.append(record)
+        if diff.left:
+            self._changed = True
+        return diff
+
+
+class PresenceHysteresis(object):
+    """Debounces presence with separate join and leave thresholds.
+
+    A new device joins only once it has been seen connected in join_polls
+    consecutive polls of its network. A present device leaves only once it has
+    been missing for leave_polls consecutive polls, and is kept while eero's
+    last_active for it is within leave_seconds.
+    """
+
+    def __init__(self, join_polls=1, leave_polls=1, leave_seconds=0, clock=time.time):
+        self.join_polls = max(join_polls, 1)
+        self.leave_polls = max(leave_polls, 1)
+        self.leave_seconds = leave_seconds
+        self._clock = clock
+        self._sightings = {}  # network_id -> {mac: consecutive polls seen before joining}
+        self._misses = {}     # network_id -> {mac: consecutive polls missed while present}
+
+    @property
+    def enabled(self):
+        return self.join_polls > 1 or self.leave_polls > 1 or self.leave_seconds > 0
+
+    def apply(self, registry, network_id, seen, last_active=None):
+        """Adjusts one poll's seen mapping (mac -> (nickname, hostname, wireless, node, band)) in place.
+
+        last_active maps mac -> unix time for present devices that the poll no
+        longer reports as connected. Returns seen, ready for registry.update_network.
+        """
+        if self.join_polls > 1:
+            sightings = self._sightings.get(network_id, {})
+            pending = {}
+            for mac in [mac for mac in seen if mac not in registry]:
+                count = sightings.get(mac, 0) + 1
+                if count < self.join_polls:
+                    pending[mac] = count
+                    del seen[mac]
+            # a device missing from this poll starts counting again
+            self._sightings[network_id] = pending
+            if pending:
+                METRICS.inc(PRESENCE_DEBOUNCED, len(pending), change='join')
+
+        if self.leave_polls > 1 or self.leave_seconds > 0:
+            misses = self._misses.get(network_id, {})
+            kept = {}
+            now = self._clock()
+            for mac in registry.network_macs(network_id):
+                if mac in seen:
+                    continue
+                count = misses.get(mac, 0) + 1
+                active = last_active.get(mac) if last_active else None
+                if count < self.leave_polls or (active is not None and now - active < self.leave_seconds):
+                    record = registry.get(mac)
+                    seen[mac] = (record.nickname, record.hostname, record.wireless, record.node, record.band)
+                    kept[mac] = count
+            self._misses[network_id] = kept
+            if kept:
+                METRICS.inc(PRESENCE_DEBOUNCED, len(kept), change='leave')
+        return seen
+
+    def forget(self, network_id):
+        self._sightings.pop(network_id, None)
+        self._misses.pop(network_id, None)
+
+
+def inactive_last_active(registry, network_id, devices):
+    """mac -> eero's last_active (unix time) for a network's present devices no longer reported connected"""
+    present = registry.network_macs(network_id)
+    last_active = {}
+    for device in devices:
+        if device['connected'] or not device.get('last_active'):
+            continue
+        mac = canonical_mac(device['mac'])
+        if mac in present:
+            try:
+                last_active[mac] = datetime.datetime.fromisoformat(
+                    device['last_active'].replace('Z', '+00:00')).timestamp()
+            except ValueError:
+                pass
+    return last_active
@@ -0,0 +1,275 @@
+"""
+On-demand profiling of the running integration.
+
+PROFILER wraps every scan (legacy scanners and config entry coordinators).
+Once armed by the profile_scans service it profiles the next N scans, either
+with cProfile (deterministic; the scanning thread plus the worker pool tasks
+it waits on) or with a sampling profiler that snapshots the stacks of every
+thread running eero_tracker code, then writes a report. Scans running on the
+event loop are always sampled: cProfile would also charge them for whatever
+else the loop runs while they await. memory_snapshot writes tracemalloc
+statistics, compared with the previous snapshot.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+_LOGGER = logging.getLogger(__name__)
+
+MODE_CPROFILE = 'cprofile'
+MODE_SAMPLING = 'sampling'
+
+DEFAULT_SAMPLE_INTERVAL = 0.005  # seconds
+TOP_ENTRIES = 40
+TRACEMALLOC_FRAMES = 10
+
+_COMPONENT_DIR = os.path.dirname(os.path.abspath(__file__))
+# background threads that spend their time waiting in eero_tracker code, not scanning
+_IDLE_THREADS = frozenset(['eero_poller_dispatch', 'eero_tracker_daemon_subscriber',
+                           'eero_tracker_daemon_accept', 'eero_tracker_daemon_client'])
+
+
+def _write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+    _LOGGER.warning(f"eero_tracker report written to {path}")
+
+
+class _Sampler(object):
+    """Counts collapsed stacks (root;...;leaf) of threads running eero_tracker code"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.active = False  # only sample while a profiled scan is running
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='eero_tracker_sampler', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            if not self.active:
+                continue
+            self.samples += 1
+            skip = {thread.ident for thread in threading.enumerate() if thread.name in _IDLE_THREADS}
+            skip.add(own)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id in skip:
+                    continue
+                stack = []
+                ours = False
+                while frame is not None:
+                    code = frame.f_code
+                    ours = ours or code.co_filename.startswith(_COMPONENT_DIR)
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if ours:
+                    self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def report(self):
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(self.stacks.values()) or 1
+        lines = [f"{self.samples} samples every {self.interval * 1000:.1f} ms", '',
+                 'Top functions (self samples):']
+        lines += [f"{count:8d} {count * 100.0 / total:5.1f}%  {leaf}" for leaf, count in leaves.most_common(TOP_ENTRIES)]
+        lines += ['', 'Collapsed stacks (flamegraph.pl / speedscope input):']
+        lines += [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        return '\n'.join(lines) + '\n'
+
+
+class ScanProfiler(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._running = 0
+        self._profiling = 0  # running scans under cProfile
+        self._sampling = 0   # running scans under the sampler
+        self._profiled = False
+        self._mode = None
+        self._report_path = None
+        self._defer = None
+        self._sample_interval = DEFAULT_SAMPLE_INTERVAL
+        self._profile = None
+        self._task_profiles = []
+        self._sampler = None
+        self._scan_times = []
+
+    @property
+    def armed(self):
+        return self._remaining > 0
+
+    def start(self, mode, scans, report_path, sample_interval=DEFAULT_SAMPLE_INTERVAL, defer=None):
+        """Profiles the next scans scans; defer(func, *args) runs the report write (e.g. hass.add_job)"""
+        with self._lock:
+            if self._remaining:
+                raise RuntimeError('A profile is already running')
+            self._mode = mode
+            self._remaining = scans
+            self._report_path = report_path
+            self._defer = defer
+            self._sample_interval = sample_interval
+            self._profiled = False
+            self._scan_times = []
+            if mode == MODE_SAMPLING:
+                self._sampler = _Sampler(sample_interval)
+            else:
+                self._profile = cProfile.Profile()
+        _LOGGER.warning(f"eero_tracker profiling the next {scans} scans ({mode}) into {report_path}")
+
+    @contextmanager
+    def scan(self, on_loop=False):
+        """Wraps one scan; a no-op unless a profile is armed. Pass on_loop for scans that await"""
+        if not self._remaining:
+            yield
+            return
+
+        with self._lock:
+            self._running += 1
+            sampled = on_loop or self._profile is None
+            if sampled:
+                if self._sampler is None:
+                    self._sampler = _Sampler(self._sample_interval)
+                self._sampling += 1
+                self._sampler.active = True
+            else:
+                self._profiling += 1
+                if self._profiling == 1:
+                    self._profile.enable()
+                    self._profiled = True
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._running -= 1
+                if sampled:
+                    self._sampling -= 1
+                    self._sampler.active = self._sampling > 0
+                else:
+                    self._profiling -= 1
+                    if not self._profiling:
+                        self._profile.disable()
+                self._scan_times.append(elapsed)
+                self._remaining -= 1
+                finished = self._remaining <= 0 and not self._running
+            if finished:
+                self._finish()
+
+    @contextmanager
+    def task(self):
+        """Wraps work a scan hands to another thread, so cProfile sees the worker pool too"""
+        if self._profile is None or not self._running:
+            yield
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active cProfile per process; only the scan thread is profiled
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self._task_profiles.append(profile)
+
+    def _finish(self):
+        with self._lock:
+            profiles = ([self._profile] if self._profiled else []) + self._task_profiles
+            sampler = self._sampler
+            self._profile = self._sampler = None
+            self._task_profiles = []
+            self._remaining = 0
+            path, defer, mode, times = self._report_path, self._defer, self._mode, self._scan_times
+
+        # the last scan may have run on the event loop; formatting and writing happen in defer
+        if defer is not None:
+            defer(self._report, path, mode, times, profiles, sampler)
+        else:
+            self._report(path, mode, times, profiles, sampler)
+
+    @staticmethod
+    def _report(path, mode, times, profiles, sampler):
+        text = (f"eero_tracker {mode} profile of {len(times)} scans, "
+                f"{sum(times) * 1000:.1f} ms total, {max(times) * 1000:.1f} ms slowest\n\n")
+        if profiles:
+            stream = io.StringIO()
+            stats = pstats.Stats(profiles[0], stream=stream)
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_ENTRIES)
+            stats.sort_stats(pstats.SortKey.TIME).print_stats(TOP_ENTRIES)
+            text += stream.getvalue()
+        if sampler is not None:
+            sampler.stop()
+            if mode != MODE_SAMPLING:
+                text += '\nScans on the event loop (sampled):\n'
+            text += sampler.report()
+        _write(path, text)
+
+
+PROFILER = ScanProfiler()
+
+
+class MemorySnapshots(object):
+    """tracemalloc snapshots, each reported against the previous one"""
+
+    def __init__(self):
+        self._previous = None
+
+    def capture(self, report_path, state=None):
+        """Takes a snapshot and writes the report; blocking, so run it in the executor.
+
+        state is an optional {name: value} summary of the scanners' state to include.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._previous = None
+            _write(report_path, 'tracemalloc started; call memory_snapshot again to capture allocations\n')
+            return
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"traced memory {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB", '']
+        if state:
+            lines += ['Scanner state:'] + [f"  {name}: {value}" for name, value in state.items()] + ['']
+
+        ours = snapshot.filter_traces((tracemalloc.Filter(True, os.path.join(_COMPONENT_DIR, '*')),))
+        lines += ['Top eero_tracker allocations:']
+        lines += [f"  {stat}" for stat in ours.statistics('lineno')[:TOP_ENTRIES]]
+        if self._previous is not None:
+            lines += ['', 'Largest changes since the previous snapshot:']
+            lines += [f"  {stat}" for stat in snapshot.compare_to(self._previous, 'lineno')[:TOP_ENTRIES]]
+        self._previous = snapshot
+        _write(report_path, '\n'.join(lines) + '\n')
+
+    def stop(self):
+        self._previous = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+MEMORY = MemorySnapshots()
@@ -0,0 +1,182 @@
+"""
+Token-bucket request budget per eero account, shared between processes.
+
+Every request sent for an account takes a token from that account's bucket.
+The bucket refills at the configured requests per minute up to its burst size,
+so the account's total request rate holds no matter how many scanners, config
+entries or CLI runs poll it. The bucket lives in a small state file next to the
+session file and is updated under an advisory lock, so separate processes draw
+from the same budget.
+
+Requests are prioritized: a session refresh may use the last token, presence
+(device list) polls must leave one for a refresh, and account lookups must
+leave a reserve, so a burst of lookups can never starve presence.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # e.g. the CLI on Windows; the budget is then only shared in-process
+    fcntl = None
+
+from .transport import ClientException
+
+_LOGGER = logging.getLogger(__name__)
+
+PRIORITY_REFRESH = 0
+PRIORITY_PRESENCE = 1
+PRIORITY_ACCOUNT = 2
+
+DEFAULT_REQUESTS_PER_MINUTE = 60
+DEFAULT_BURST = 20
+MAX_WAIT = 10.0  # seconds a request may wait for a token before it fails as rate limited
+
+
+def priority_for(method, action):
+    if action.startswith('login'):
+        return PRIORITY_REFRESH
+    if action.endswith('/devices'):
+        return PRIORITY_PRESENCE
+    return PRIORITY_ACCOUNT
+
+
+def strictest_budget(budgets):
+    """The strictest of several (requests per minute, burst) budgets, where 0 requests per minute is unlimited"""
+    limited = [budget for budget in budgets if budget[0]]
+    if not limited:
+        return 0, DEFAULT_BURST
+    return min(rate for rate, _ in limited), min(burst for _, burst in limited)
+
+
+class RateLimiter(object):
+    _limiters = {}
+    _limiters_lock = threading.Lock()
+
+    @classmethod
+    def for_file(cls, session_file, requests_per_minute=None, burst=None):
+        """Returns the limiter shared by everything in this process using session_file.
+
+        A caller passing requests_per_minute (0 for unlimited) and/or burst
+        registers that budget; the account then runs on the strictest budget
+        registered, whatever order its users were set up in. Callers passing
+        None leave the budget to the others, or to the defaults if nobody sets one.
+        """
+        state_file = os.path.splitext(os.path.abspath(session_file))[0] + '.ratelimit'
+        with cls._limiters_lock:
+            limiter = cls._limiters.get(state_file)
+            if limiter is None:
+                limiter = cls._limiters[state_file] = cls(state_file)
+            if requests_per_minute is not None or burst is not None:
+                limiter._budgets.append((DEFAULT_REQUESTS_PER_MINUTE if requests_per_minute is None
+                                         else requests_per_minute,
+                                         DEFAULT_BURST if burst is None else burst))
+                limiter.configure(*strictest_budget(limiter._budgets))
+            return limiter
+
+    def __init__(self, state_file, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, burst=DEFAULT_BURST,
+                 clock=time.time, sleep=time.sleep):
+        self.state_file = state_file
+        self._clock = clock  # wall clock, as the state is shared with other processes
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = None
+        self._updated = None
+        self._budgets = []  # (requests per minute, burst) registered through for_file
+        self._local = threading.local()  # .prepaid: a token taken for this thread by a worker pool
+        self.configure(requests_per_minute, burst)
+
+    @property
+    def unlimited(self):
+        return not self.rate
+
+    def configure(self, requests_per_minute, burst):
+        """Sets the budget; 0 requests per minute means unlimited"""
+        self.rate = requests_per_minute / 60.0
+        self.burst = max(burst, 1)
+        reserve = min(max(2, self.burst // 4), self.burst - 1)
+        self._floors = {PRIORITY_REFRESH: 0, PRIORITY_PRESENCE: min(1, self.burst - 1), PRIORITY_ACCOUNT: reserve}
+
+    @contextmanager
+    def _shared_state(self):
+        """Yields [tokens, updated] read from the state file, writing back any change on exit"""
+        with self._lock:
+            if fcntl is None:
+                state = [self._tokens, self._updated]
+                yield state
+                self._tokens, self._updated = state
+                return
+
+            fd = os.open(self.state_file, os.O_RDWR | os.O_CREAT, 0o600)
+            with os.fdopen(fd, 'r+') as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    try:
+                        data = json.loads(f.read() or '{}')
+                        state = [data.get('tokens'), data.get('updated')]
+                    except ValueError:
+                        state = [None, None]
+                    original = list(state)
+                    yield state
+                    if state != original:
+                        # rewritten in place; losing an update in a crash only loses a few tokens
+                        f.seek(0)
+                        f.truncate()
+                        f.write(json.dumps(dict(tokens=state[0], updated=state[1])))
+                        f.flush()
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def try_acquire(self, priority=PRIORITY_PRESENCE):
+        """Takes a token if one is available at this priority; returns 0, or the seconds to wait"""
+        if self.unlimited:
+            return 0
+        needed = 1 + self._floors.get(priority, 0)
+        with self._shared_state() as state:
+            now = self._clock()
+            tokens, updated = state
+            if tokens is None or updated is None:
+                tokens, updated = float(self.burst), now
+            tokens = min(float(self.burst), tokens + max(0.0, now - updated) * self.rate)
+            state[:] = [tokens, now]
+            if tokens >= needed:
+                state[0] = tokens - 1
+                return 0
+            return (needed - tokens) / self.rate
+
+    @contextmanager
+    def prepaid(self):
+        """Runs the block with a token already taken by try_acquire: the first acquire() in this thread
+        uses it instead of waiting, and it is given back if nothing in the block sent a request"""
+        self._local.prepaid = True
+        try:
+            yield
+        finally:
+            unused = self._local.prepaid
+            self._local.prepaid = False
+            if unused:
+                self.refund()
+
+    def refund(self):
+        """Gives back a token taken by try_acquire that no request ended up using"""
+        with self._shared_state() as state:
+            if state[0] is not None:
+                state[0] = min(float(self.burst), state[0] + 1)
+
+    def acquire(self, priority=PRIORITY_PRESENCE, max_wait=MAX_WAIT):
+        """Blocks until a token is taken, raising ClientException if that would take longer than max_wait"""
+        if getattr(self._local, 'prepaid', False):
+            self._local.prepaid = False
+            return
+        deadline = self._clock() + max_wait
+        while True:
+            wait = self.try_acquire(priority)
+            if not wait:
+                return
+            if self._clock() + wait > deadline:
+                raise ClientException(429, 'error.rate_limited.budget')
+            self._sleep(wait)
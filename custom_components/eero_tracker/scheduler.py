@@ -0,0 +1,90 @@
+"""
+Adaptive per-network poll scheduling.
+
+Every network keeps its own interval: a network whose devices changed on the
+last poll is polled again at the minimum interval, while a quiet one backs off
+gradually up to the maximum. Failed polls (429s, 5xx, connection errors, a
+session refresh that did not recover) back off exponentially with jitter so a
+struggling API is not hammered by every network at once.
+"""
+import random
+import time
+
+# how much earlier than its due time a network may be polled, so a scan tick that
+# lands a moment early does not push the network back a whole tick
+SCHEDULE_SLACK = 2
+
+QUIET_GROWTH = 1.5
+MAX_BACKOFF = 900
+
+
+class NetworkPollState(object):
+    __slots__ = ('interval', 'next_poll', 'failures')
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.next_poll = 0
+        self.failures = 0
+
+
+class PollScheduler(object):
+    """Decides which networks are due for a poll; all times are in seconds"""
+
+    def __init__(self, min_interval, max_interval, max_backoff=MAX_BACKOFF,
+                 growth=QUIET_GROWTH, clock=time.monotonic, rng=random.random):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.max_backoff = max(self.max_interval, max_backoff)
+        self.growth = growth
+        self._clock = clock
+        self._rng = rng
+        self._states = {}
+
+    def _state(self, network_id):
+        state = self._states.get(network_id)
+        if state is None:
+            state = self._states[network_id] = NetworkPollState(self.min_interval)
+        return state
+
+    def is_due(self, network_id, now=None):
+        state = self._states.get(network_id)
+        if state is None:
+            return True
+        now = self._clock() if now is None else now
+        return state.next_poll <= now + SCHEDULE_SLACK
+
+    def due(self, network_ids, now=None):
+        now = self._clock() if now is None else now
+        return [network_id for network_id in network_ids if self.is_due(network_id, now)]
+
+    def interval(self, network_id):
+        """The current polling interval of a network (ignoring any failure backoff)"""
+        return self._state(network_id).interval
+
+    def record_success(self, network_id, changed, now=None):
+        """Schedules the next poll: back to the floor on churn, slower while quiet"""
+        now = self._clock() if now is None else now
+        state = self._state(network_id)
+        state.failures = 0
+        if changed:
+            state.interval = self.min_interval
+        else:
+            state.interval = min(self.max_interval, state.interval * self.growth)
+        state.next_poll = now + state.interval
+
+    def record_failure(self, network_id, now=None):
+        """Backs off exponentially, with equal jitter, after a failed poll; returns the delay"""
+        now = self._clock() if now is None else now
+        state = self._state(network_id)
+        state.failures += 1
+        delay = min(self.max_backoff, self.min_interval * 2 ** (state.failures - 1))
+        delay = delay / 2 + self._rng() * delay / 2
+        state.next_poll = now + delay
+        return delay
+
+    def forget(self, network_id):
+        self._states.pop(network_id, None)
+
+    def reset(self):
+        """Makes every network due again, e.g. after the configuration or session changed"""
+        self._states.clear()
@@ -0,0 +1,208 @@
+"""
+Diagnostic sensors exposing the eero_tracker scan and request metrics, and a
+connected devices sensor for each config entry fed by its coordinator.
+
+Device counts per connection type, network, eero node and band are read from
+the counts each scanner and coordinator keeps up to date with every poll, so
+they cost no extra API calls and never iterate over device_tracker entities.
+A sensor is added for each count as it first appears.
+"""
+import logging
+import os
+from datetime import timedelta
+
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
+from homeassistant.const import EntityCategory, UnitOfInformation, UnitOfTime
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from homeassistant.util import slugify
+
+from .const import DATA_COORDINATORS, DATA_SCANNERS, DOMAIN
+
+from .metrics import (
+    DEVICES_LAST_SCAN,
+    METRICS,
+    PARSE_DURATION,
+    REQUEST_DURATION,
+    REQUEST_ERRORS,
+    REQUESTS,
+    RESPONSE_BYTES,
+    SCAN_DURATION,
+    SESSION_REFRESHES,
+)
+from .presence import COUNT_CONNECTION, COUNT_NETWORK, COUNT_NODE
+
+_LOGGER = logging.getLogger(__name__)
+
+DEVICES_ENDPOINT = 'networks/{id}/devices'
+
+# how often legacy scanners are checked for counts (networks, nodes, bands) that have no sensor yet
+COUNT_SENSOR_DISCOVERY_INTERVAL = timedelta(minutes=1)
+
+
+def _milliseconds(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def _mean(histogram):
+    return histogram.mean if histogram is not None else None
+
+
+# (key, name, unit, state class, value function)
+METRIC_SENSORS = (
+    ('last_scan_duration', 'Last scan duration', UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT,
+     lambda: _milliseconds(METRICS.last(SCAN_DURATION))),
+    ('mean_scan_duration', 'Mean scan duration', UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT,
+     lambda: _milliseconds(_mean(METRICS.histogram(SCAN_DURATION)))),
+    ('mean_devices_request_duration', 'Mean device list request duration', UnitOfTime.MILLISECONDS,
+     SensorStateClass.MEASUREMENT,
+     lambda: _milliseconds(_mean(METRICS.histogram(REQUEST_DURATION, endpoint=DEVICES_ENDPOINT)))),
+    ('mean_devices_parse_duration', 'Mean device list parse duration', UnitOfTime.MILLISECONDS,
+     SensorStateClass.MEASUREMENT,
+     lambda: _milliseconds(_mean(METRICS.histogram(PARSE_DURATION, endpoint=DEVICES_ENDPOINT)))),
+    ('requests', 'API requests', None, SensorStateClass.TOTAL_INCREASING,
+     lambda: METRICS.total(REQUESTS)),
+    ('request_errors', 'API request errors', None, SensorStateClass.TOTAL_INCREASING,
+     lambda: METRICS.total(REQUEST_ERRORS)),
+    ('session_refreshes', 'Session refreshes', None, SensorStateClass.TOTAL_INCREASING,
+     lambda: METRICS.total(SESSION_REFRESHES)),
+    ('bytes_received', 'Bytes received', UnitOfInformation.BYTES, SensorStateClass.TOTAL_INCREASING,
+     lambda: METRICS.total(RESPONSE_BYTES)),
+    ('devices_present', 'Devices present', None, SensorStateClass.MEASUREMENT,
+     lambda: METRICS.total(DEVICES_LAST_SCAN)),
+)
+
+
+def count_description(key):
+    """(name, unique id suffix, icon) of the sensor for an aggregate count key"""
+    kind = key[0]
+    if kind == COUNT_CONNECTION:
+        return f"{key[1]} devices", f"{key[1]}_devices", 'mdi:wifi' if key[1] == 'wireless' else 'mdi:ethernet'
+    if kind == COUNT_NETWORK:
+        return f"network {key[1]} devices", f"network_{key[1]}_devices", 'mdi:devices'
+    if kind == COUNT_NODE:
+        return (f"{key[2]} eero devices", f"network_{key[1]}_node_{slugify(key[2])}_devices",
+                'mdi:router-wireless')
+    return f"{key[1]} devices", f"band_{slugify(key[1])}_devices", 'mdi:wifi'
+
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    """Set up the metric and legacy scanner count sensors; only loaded through discovery by the integration"""
+    if discovery_info is None:
+        return
+    async_add_entities([EeroMetricSensor(*description) for description in METRIC_SENSORS])
+
+    known = set()
+
+    @callback
+    def add_count_sensors(now=None):
+        # scanners are set up by the device_tracker platform, possibly after this one
+        new = []
+        for scanner in hass.data.get(DOMAIN, {}).get(DATA_SCANNERS, []):
+            for key in scanner.snapshot.counts:
+                if (scanner.session_file, key) not in known:
+                    known.add((scanner.session_file, key))
+                    new.append(EeroCountSensor(scanner, key))
+        if new:
+            async_add_entities(new, update_before_add=True)
+
+    add_count_sensors()
+    async_track_time_interval(hass, add_count_sensors, COUNT_SENSOR_DISCOVERY_INTERVAL)
+
+
+class EeroMetricSensor(SensorEntity):
+    """One eero_tracker metric, read from the in-process metrics registry"""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, key, name, unit, state_class, value_fn):
+        self._value_fn = value_fn
+        self._attr_name = f"Eero tracker {name.lower()}"
+        self._attr_unique_id = f"eero_tracker_metric_{key}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_state_class = state_class
+
+    def update(self):
+        self._attr_native_value = self._value_fn()
+
+
+class EeroCountSensor(SensorEntity):
+    """Devices present under one of a legacy scanner's aggregate counts"""
+
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, scanner, key):
+        self._scanner = scanner
+        self._key = key
+        name, unique_id, icon = count_description(key)
+        stem = os.path.splitext(os.path.basename(scanner.session_file))[0]
+        # the default eero.session keeps the plain names
+        prefix = 'Eero tracker' if stem == 'eero' else f"Eero tracker {stem}"
+        self._attr_name = f"{prefix} {name}"
+        self._attr_unique_id = f"eero_tracker_{slugify(stem)}_{unique_id}"
+        self._attr_icon = icon
+
+    async def async_update(self):
+        # the snapshot is immutable, so reading it on the event loop is safe while a scan runs
+        self._attr_native_value = self._scanner.snapshot.count(*self._key)
+
+
+async def async_setup_entry(hass, entry, async_add_entities):
+    coordinator = hass.data[DOMAIN][DATA_COORDINATORS][entry.entry_id]
+    async_add_entities([EeroConnectedDevicesSensor(coordinator)])
+
+    known = set()
+
+    @callback
+    def add_count_sensors():
+        new = [key for key in coordinator.snapshot.counts if key not in known]
+        if new:
+            known.update(new)
+            async_add_entities([EeroCoordinatorCountSensor(coordinator, key) for key in new])
+
+    add_count_sensors()
+    entry.async_on_unload(coordinator.async_add_listener(add_count_sensors))
+
+
+class EeroConnectedDevicesSensor(CoordinatorEntity, SensorEntity):
+    """Devices currently connected to the entry's eero account"""
+
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_icon = 'mdi:devices'
+
+    def __init__(self, coordinator):
+        super().__init__(coordinator)
+        self._attr_name = f"{coordinator.entry.title} connected devices"
+        self._attr_unique_id = f"{coordinator.entry.entry_id}_connected_devices"
+
+    @property
+    def native_value(self):
+        return len(self.coordinator.snapshot)
+
+
+class EeroCoordinatorCountSensor(CoordinatorEntity, SensorEntity):
+    """Devices present under one of a config entry's aggregate counts"""
+
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, coordinator, key):
+        super().__init__(coordinator)
+        self._key = key
+        name, unique_id, icon = count_description(key)
+        self._attr_name = f"{coordinator.entry.title} {name}"
+        self._attr_unique_id = f"{coordinator.entry.entry_id}_{unique_id}"
+        self._attr_icon = icon
+        self._written = None
+
+    @callback
+    def _handle_coordinator_update(self):
+        # most polls leave most counts unchanged; only write the ones that moved
+        value = self.native_value
+        if value != self._written:
+            self._written = value
+            self.async_write_ha_state()
+
+    @property
+    def native_value(self):
+        return self.coordinator.snapshot.count(*self._key)
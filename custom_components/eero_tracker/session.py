@@ -0,0 +1,117 @@
+"""
+Single-flight management of the eero.session file.
+
+Pollers, the config flow and the CLI can all hit error.session.refresh at the
+same moment. SessionManager makes sure only one refresh actually happens:
+threads in a process wait on a lock, other processes wait on an advisory lock
+file, and whoever arrives second picks up the token the first one already
+wrote instead of refreshing again. The file is always replaced atomically.
+"""
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # e.g. the CLI on Windows; refreshes are then only coalesced in-process
+    fcntl = None
+
+from .storage import atomic_write
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SessionManager(object):
+    _managers = {}
+    _managers_lock = threading.Lock()
+
+    @classmethod
+    def for_file(cls, session_file):
+        """Returns the manager shared by everything in this process using session_file"""
+        session_file = os.path.abspath(session_file)
+        with cls._managers_lock:
+            manager = cls._managers.get(session_file)
+            if manager is None:
+                manager = cls._managers[session_file] = cls(session_file)
+            return manager
+
+    def __init__(self, session_file):
+        self.session_file = os.path.abspath(session_file)
+        self.lock_file = self.session_file + '.lock'
+        self._lock = threading.Lock()
+        self._token = self._read()
+
+    @property
+    def token(self):
+        return self._token
+
+    def settled_token(self):
+        """The token once any refresh this process has in progress has finished"""
+        with self._lock:
+            return self._token
+
+    def _read(self):
+        try:
+            with open(self.session_file, 'r') as f:
+                return f.read().replace('\n', '') or None
+        except IOError:
+            return None
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_file, 'a+') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _write(self, token):
+        # update in-memory session first, in case there is any failure in writing to the
+        # session file, at least this process will continue working until it restarts
+        self._token = token
+        try:
+            atomic_write(self.session_file, token)
+        except (IOError, OSError):
+            _LOGGER.error(f"Could not update eero session key in {self.session_file}")
+
+    def reload(self):
+        """Re-reads the session file, e.g. after another process logged in"""
+        with self._lock:
+            self._token = self._read()
+            return self._token
+
+    def store(self, token):
+        """Saves a new session key (after a login)"""
+        with self._lock, self._file_lock():
+            self._write(token)
+
+    def refresh(self, stale_token, refresh_func):
+        """Replaces stale_token with refresh_func(stale_token), at most once across threads and processes.
+
+        Returns the current token, which is the stale one if refresh_func gave
+        nothing back. refresh_func exceptions propagate to the caller.
+        """
+        with self._lock:
+            if self._token is not None and self._token != stale_token:
+                # another thread refreshed while we waited for the lock
+                return self._token
+
+            with self._file_lock():
+                on_disk = self._read()
+                if on_disk is not None and on_disk != stale_token:
+                    _LOGGER.debug(f"Using eero session key refreshed by another process in {self.session_file}")
+                    self._token = on_disk
+                    return on_disk
+
+                new_token = refresh_func(stale_token)
+                if not new_token:
+                    return self._token
+
+                _LOGGER.debug(f"Updating {self.session_file} with new session key")
+                self._write(new_token)
+                return new_token
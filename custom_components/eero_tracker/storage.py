@@ -0,0 +1,43 @@
+"""
+Small helpers for the files the integration keeps in the config directory.
+"""
+import os
+import json
+import tempfile
+
+
+def atomic_write(path, data):
+    """Writes data (str or bytes) to path via a temp file and rename, so readers never see a torn file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    mode = 'wb' if isinstance(data, (bytes, bytearray)) else 'w'
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def read_json(path):
+    """Returns the decoded file, or None if it is missing or unreadable"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def write_json(path, obj):
+    atomic_write(path, json.dumps(obj, separators=(',', ':')))
+
+
+def sibling_path(path, suffix):
+    """eero.session -> eero.<suffix>, keeping companion files next to the session file"""
+    return os.path.splitext(path)[0] + '.' + suffix
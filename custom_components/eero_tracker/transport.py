@@ -0,0 +1,99 @@
+"""
+Pooled HTTP transport shared by every eero API caller (the eero client, the
+device_tracker scanner and eero_tracker_instantiate.py).
+
+A single keep-alive requests.Session is reused for every request so polls do
+not pay a TLS handshake each time, and responses are parsed straight from the
+raw (gzip-negotiated) bytes.
+"""
+import json
+import threading
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API_ENDPOINT = 'https://api-user.e2ro.com/2.2/{}'
+
+# one host is all we ever talk to, but several pollers may share the pool
+POOL_CONNECTIONS = 2
+POOL_MAXSIZE = 16
+
+# seconds; without them a hung eero API holds a worker thread per request indefinitely
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+
+
+class ClientException(Exception):
+    def __init__(self, status, error_message):
+        super(ClientException, self).__init__()
+        self.status = status
+        self.error_message = error_message
+
+
+def parse_body(body):
+    """Decodes an eero API envelope (str or bytes), raising ClientException on errors"""
+    data = json.loads(body)
+    if data['meta']['code'] != 200 and data['meta']['code'] != 201:
+        raise ClientException(data['meta']['code'],
+                              data['meta'].get('error', ""))
+    return data.get('data', "")
+
+
+def parse_http_body(status_code, body, parser=parse_body):
+    """Parses a response body, turning non-JSON error pages (429s, proxy 5xx) into ClientException"""
+    try:
+        return parser(body)
+    except ValueError:
+        raise ClientException(status_code, 'error.http')
+
+
+def parse_response(response):
+    # json.loads detects the encoding of raw bytes itself, so skip building .text
+    return parse_http_body(response.status_code, response.content)
+
+
+class Transport(object):
+    """Owns the pooled requests.Session used to talk to the eero API"""
+
+    def __init__(self, api_endpoint=API_ENDPOINT, pool_maxsize=POOL_MAXSIZE, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        self.api_endpoint = api_endpoint
+        self.timeout = timeout
+        self.session = requests.Session()
+
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip',
+        })
+
+        # the pool may be shared by several accounts, so session cookies live in
+        # each Client's own jar and never in the shared session
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    def request(self, method, action, **kwargs):
+        """Sends a request and returns the raw requests.Response"""
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            return self.session.request(method, self.api_endpoint.format(action), **kwargs)
+        except requests.RequestException as exception:
+            # surface connection problems the same way as API errors, without a status
+            raise ClientException(None, f"error.connection: {exception}") from exception
+
+    def close(self):
+        self.session.close()
+
+
+_shared_transport = None
+_shared_transport_lock = threading.Lock()
+
+
+def shared_transport():
+    """Returns the process-wide Transport, creating it on first use"""
+    global _shared_transport
+    with _shared_transport_lock:
+        if _shared_transport is None:
+            _shared_transport = Transport()
+        return _shared_transport
@@ -1,160 +1,281 @@
-import re
-import json
-import requests
-from argparse import ArgumentParser
-from abc import abstractproperty
-
-__version__ = "0.0.1"
-__all__ = ['ClientException', 'Eero', 'SessionStorage', '__version__']
-
-
-class Eero(object):
-    def __init__(self, arg_session):
-        # type(SessionStorage) -> ()
-        self.session = arg_session
-        self.client = Client()
-
-    @property
-    def _cookie_dict(self):
-        if self.needs_login():
-            return dict()
-        else:
-            return dict(s=self.session.cookie)
-
-    def needs_login(self):
-        return self.session.cookie is None
-
-    def login(self, identifier):
-        # type(string) -> string
-        json = dict(login=identifier)
-        data = self.client.post('login', json=json)
-        return data['user_token']
-
-    def login_verify(self, verification_code, user_token):
-        json = dict(code=verification_code)
-        response = self.client.post('login/verify', json=json,
-                                    cookies=dict(s=user_token))
-        self.session.cookie = user_token
-        return response
-
-    def refreshed(self, func):
-        try:
-            return func()
-        except ClientException as exception:
-            if exception.status == 401 and exception.error_message == 'error.session.refresh':
-                self.login_refresh()
-                return func()
+"""
+Creates the eero.session used by the eero_tracker integration, and lists the
+devices on your eero networks.
+
+    python3 eero_tracker_instantiate.py                  # log in, or list connected wireless devices
+    python3 eero_tracker_instantiate.py --format ndjson --all
+    python3 eero_tracker_instantiate.py --watch 30       # print presence changes as they happen
+    python3 eero_tracker_instantiate.py --serve eero.sock   # poll once for every local consumer
+    python3 eero_tracker_instantiate.py --daemon eero.sock --watch 0
+
+Nothing is imported or read until main() runs, so the script starts fast and
+can be imported by other tools.
+"""
+import os
+import sys
+
+__version__ = "0.0.2"
+__all__ = ['ClientException', 'Eero', 'SessionStorage', '__version__', 'main']
+
+DEFAULT_SESSION_FILE = 'eero.session'
+MINIMUM_WATCH_INTERVAL = 25
+DUMP_FIELDS = ('connected', 'wireless', 'mac', 'nickname', 'hostname', 'ip', 'manufacturer')
+
+
+def _load_module(name):
+    """Imports eero_tracker.<name> from the custom_components/ folder next to this script.
+
+    The package is registered by path so its __init__ (which needs Home Assistant)
+    is never executed; only the HA-free client modules are loaded.
+    """
+    import importlib
+    import types
+
+    if 'eero_tracker' not in sys.modules:
+        component_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     'custom_components', 'eero_tracker')
+        package = types.ModuleType('eero_tracker')
+        package.__path__ = [component_dir]
+        sys.modules['eero_tracker'] = package
+    return importlib.import_module(f"eero_tracker.{name}")
+
+
+def __getattr__(name):
+    # keep `from eero_tracker_instantiate import Eero` working without importing at startup
+    if name in ('ClientException', 'CookieStore', 'Eero', 'SessionStorage'):
+        return getattr(_load_module('eero'), name)
+    raise AttributeError(name)
+
+
+def login(eero, login_id=None):
+    if login_id is None:
+        login_id = input('Your eero login (email address or SMS phone number): ')
+    user_token = eero.login(login_id)
+    verification_code = input('Verification key from email or SMS: ')
+    eero.login_verify(verification_code, user_token)
+
+
+class RowWriter(object):
+    """Writes device rows as the legacy text lines, CSV or NDJSON, flushing after every batch"""
+
+    def __init__(self, output_format, stream=None):
+        self.format = output_format
+        self.stream = stream = stream if stream is not None else sys.stdout
+        if output_format == 'csv':
+            import csv
+            self._csv = csv.writer(stream)
+            self._csv.writerow(('network_id',) + DUMP_FIELDS)
+        elif output_format == 'ndjson':
+            import json
+            self._dumps = json.dumps
+
+    def write(self, network_id, devices):
+        for device in devices:
+            if self.format == 'text':
+                self.stream.write("{}, {}, {}\n".format(device['nickname'], device['hostname'], device['mac']))
+            elif self.format == 'csv':
+                self._csv.writerow((network_id,) + tuple(device.get(field) for field in DUMP_FIELDS))
             else:
-                raise
-
-    def login_refresh(self):
-        response = self.client.post('login/refresh', cookies=self._cookie_dict)
-        self.session.cookie = response['user_token']
-
-    def account(self):
-        return self.refreshed(lambda: self.client.get(
-            'account',
-            cookies=self._cookie_dict))
-
-    @staticmethod
-    def id_from_url(id_or_url):
-        match = re.search('^[0-9]+$', id_or_url)
-        if match:
-            return match.group(0)
-        match = re.search(r'\/([0-9]+)$', id_or_url)
-        if match:
-            return match.group(1)
-
-    def devices(self, network_id):
-        return self.refreshed(lambda: self.client.get(
-            'networks/{}/devices'.format(
-                self.id_from_url(network_id)), cookies=self._cookie_dict))
-
-
-class SessionStorage(object):
-    @abstractproperty
-    def cookie(self):
-        pass
+                self.stream.write(self._dumps({'network_id': network_id, **device}, separators=(',', ':')) + '\n')
+        self.stream.flush()
+
+
+def dump(eero, output_format, include_all=False):
+    """Fetches every network in parallel, writing each one's devices as soon as it arrives"""
+    from concurrent.futures import as_completed
 
+    poller = _load_module('poller')
+    pool = poller.shared_pool()
+    writer = RowWriter(output_format)
 
-class ClientException(Exception):
-    def __init__(self, status, error_message):
-        super(ClientException, self).__init__()
-        self.status = status
-        self.error_message = error_message
+    account = eero.account()
+    futures = {pool.submit('cli', eero.devices, network['url'], DUMP_FIELDS):
+               poller.network_id_from_url(network['url'])
+               for network in account['networks']['data']}
 
+    failed = False
+    for future in as_completed(futures):
+        network_id = futures[future]
+        try:
+            devices = future.result()
+        except _load_module('eero').ClientException as exception:
+            sys.stderr.write(f"network {network_id}: {exception.error_message}\n")
+            failed = True
+            continue
+        if not include_all:
+            devices = [device for device in devices if device['wireless'] and device['connected']]
+        writer.write(network_id, devices)
+    return 1 if failed else 0
+
+
+def _change_printer(output_format):
+    """Returns emit(change, record, previous nickname) printing one presence change"""
+    if output_format == 'ndjson':
+        import json
+
+        def emit(change, record, previous=None):
+            event = dict(change=change, network_id=record.network_id, mac=record.mac,
+                         nickname=record.nickname, hostname=record.hostname)
+            if previous is not None:
+                event['previous_nickname'] = previous
+            print(json.dumps(event, separators=(',', ':')), flush=True)
+    else:
+        symbols = dict(joined='+', left='-', renamed='~')
+
+        def emit(change, record, previous=None):
+            renamed = f" (was {previous})" if previous is not None else ''
+            print(f"{symbols[change]} {record.nickname}, {record.hostname}, {record.mac}{renamed}", flush=True)
+    return emit
+
+
+def watch(session_file, interval, output_format, include_all=False, transport=None):
+    """Polls on one kept-alive connection and prints only the presence changes between polls"""
+    import time
+
+    filters = _load_module('filters')
+    poller = _load_module('poller')
+    multi = poller.MultiAccountPoller(transport=transport, min_interval=interval, max_interval=interval)
+    multi.add_account('cli', session_file, filters.DeviceFilter(only_wireless=not include_all))
+    emit = _change_printer(output_format)
+
+    try:
+        while True:
+            diff = multi.poll()['cli']
+            for record in diff.joined:
+                emit('joined', record)
+            for record in diff.left:
+                emit('left', record)
+            for record, previous in diff.renamed:
+                emit('renamed', record, previous)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        return 0
+
+
+def serve(session_file, socket_path, interval, api_endpoint=None):
+    """Runs the poller daemon until interrupted, publishing every poll on socket_path"""
+    import logging
+    import signal
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    daemon = _load_module('daemon').PollerDaemon(socket_path, session_file, interval, api_endpoint=api_endpoint)
+    try:
+        daemon.bind()
+    except RuntimeError as exception:
+        sys.stderr.write(f"{exception}\n")
+        return 1
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
 
-class Client(object):
-    API_ENDPOINT = 'https://api-user.e2ro.com/2.2/{}'
 
-    @staticmethod
-    def _parse_response(response):
-        data = json.loads(response.text)
-        if data['meta']['code'] != 200 and data['meta']['code'] != 201:
-            raise ClientException(data['meta']['code'],
-                                  data['meta'].get('error', ""))
-        return data.get('data', "")
+def follow(socket_path, output_format, include_all=False, changes=False):
+    """Lists the devices a running poller daemon sees, or with changes prints its presence changes"""
+    import time
 
-    def post(self, action, **kwargs):
-        response = requests.post(self.API_ENDPOINT.format(action), **kwargs)
-        return self._parse_response(response)
+    daemon = _load_module('daemon')
+    device_filter = _load_module('filters').DeviceFilter(only_wireless=not include_all)
+    DeviceState = _load_module('presence').DeviceState
 
-    def get(self, action, **kwargs):
-        response = requests.get(self.API_ENDPOINT.format(action), **kwargs)
-        return self._parse_response(response)
+    def accepted(entry):
+        return device_filter.accepts(entry[0], entry[2], entry[4])
 
+    if not changes:
+        subscriber = daemon.DaemonSubscriber(socket_path).start()
+        if not subscriber.wait_synced(timeout=10):
+            sys.stderr.write(f"Could not reach the eero_tracker daemon at {socket_path}\n")
+            return 1
+        _, devices, _ = subscriber.take()
+        subscriber.stop()
+        writer = RowWriter(output_format)
+        for network_id, entries in sorted(devices.items()):
+            writer.write(network_id, [dict(DeviceState(*entry)._asdict(), connected=True)
+                                      for entry in entries if accepted(entry)])
+        return 0
 
-class CookieStore(SessionStorage):
-    def __init__(self, cookie_file):
-        from os import path
-        self.cookie_file = path.abspath(cookie_file)
+    emit = _change_printer(output_format)
 
+    def print_changes(events):
         try:
-            with open(self.cookie_file, 'r') as f:
-                self.__cookie = f.read()
-        except IOError:
-            self.__cookie = None
+            for change, entry, previous in events:
+                if change == 'left':
+                    if accepted(previous):
+                        emit('left', DeviceState(*previous))
+                elif change == 'joined':
+                    if accepted(entry):
+                        emit('joined', DeviceState(*entry))
+                elif entry[1] != previous[1] and accepted(entry):
+                    emit('renamed', DeviceState(*entry), previous[1])
+        except BrokenPipeError:
+            # called on the subscriber thread; stop the main one as __main__ would
+            import _thread
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            _thread.interrupt_main()
+
+    subscriber = daemon.DaemonSubscriber(socket_path, print_changes).start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        subscriber.stop()
+        return 0
+
+
+def main(argv=None):
+    from argparse import SUPPRESS, ArgumentParser
+
+    parser = ArgumentParser(description='Set up and inspect the eero session used by eero_tracker')
+    parser.add_argument("-l", help="Your eero login (email address or SMS phone number)")
+    parser.add_argument("--session", default=DEFAULT_SESSION_FILE, help="session file (default: eero.session)")
+    parser.add_argument("--format", choices=('text', 'csv', 'ndjson'), default='text',
+                        help="output format for devices (default: text)")
+    parser.add_argument("--all", action='store_true', help="include wired and disconnected devices")
+    parser.add_argument("--watch", type=int, metavar='SECONDS',
+                        help=f"keep polling and print only presence changes (at least {MINIMUM_WATCH_INTERVAL}s)")
+    parser.add_argument("--serve", metavar='SOCKET',
+                        help="run as a poller daemon publishing presence on a Unix socket, polling every "
+                             f"--watch seconds (default and minimum {MINIMUM_WATCH_INTERVAL})")
+    parser.add_argument("--daemon", metavar='SOCKET',
+                        help="read devices (or with --watch, changes) from a running --serve daemon instead of eero")
+    # points the script at a local mock API (see benchmarks/mock_eero_api.py)
+    parser.add_argument("--api-endpoint", help=SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.daemon is not None:
+        # the daemon owns the session; nothing here talks to eero
+        return follow(args.daemon, args.format, args.all, changes=args.watch is not None)
+
+    eero_module = _load_module('eero')
+    # shares the account's request budget with Home Assistant if it is polling the same session
+    ratelimit = _load_module('ratelimit')
+    client = eero_module.Client(api_endpoint=args.api_endpoint,
+                                rate_limiter=ratelimit.RateLimiter.for_file(args.session))
+    eero = eero_module.Eero(eero_module.CookieStore(args.session), client)
 
-    @property
-    def cookie(self):
-        return self.__cookie
+    if eero.needs_login():
+        login(eero, args.l)
+        print(f"Login successful. {args.session} created, you can now use the device_tracker.")
+        return 0
 
-    @cookie.setter
-    def cookie(self, cookie):
-        self.__cookie = cookie
-        with open(self.cookie_file, 'w+') as f:
-            f.write(self.__cookie)
+    if args.serve is not None:
+        return serve(args.session, args.serve, max(args.watch or 0, MINIMUM_WATCH_INTERVAL), args.api_endpoint)
 
+    if args.watch is not None:
+        interval = max(args.watch, MINIMUM_WATCH_INTERVAL)
+        return watch(args.session, interval, args.format, args.all, client.transport)
 
-session = CookieStore('eero.session')
-eero = Eero(session)
+    if args.format == 'text':
+        print(f"{args.session} already created dumping all devices")
+    return dump(eero, args.format, args.all)
 
-if __name__ == '__main__':
-    if eero.needs_login():
 
-        try:
-            input = raw_input
-        except NameError:
-            pass
-
-        parser = ArgumentParser()
-        parser.add_argument("-l", help="Your eero login (email address or SMS phone number)")
-        args = parser.parse_args()
-        if args.l:
-            phone_number = args.l
-        else:
-            phone_number = input('Your eero login (email address or SMS phone number): ')
-        user_token = eero.login(phone_number)
-        verification_code = input('Verification key from email or SMS: ')
-        eero.login_verify(verification_code, user_token)
-        print('Login successful. eero.session created, you can now use the device_tracker.')
-    else:
-        print('eero.session already created dumping all devices')
-        account = eero.account()
-        for network in account['networks']['data']:
-            devices = eero.devices(network['url'])
-
-            json_obj = json.loads(json.dumps(devices, indent=4))
-            for device in json_obj:
-                if device['wireless'] and device['connected']:
-                    print("{}, {}, {}".format(device['nickname'], device['hostname'], device['mac']))
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except BrokenPipeError:
+        # output piped into something like head that stopped reading; exit quietly
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)